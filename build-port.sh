@@ -222,10 +222,16 @@ echo "Removing development artifacts..."
 rm -f port-build/share/berrypy/taskapp.log
 rm -f port-build/share/berrypy/taskmgr.html.*
 rm -f port-build/share/berrypy/oldmgr.html
+rm -f port-build/share/berrypy/bench.py
 rm -rf port-build/share/berrypy/__MACOSX
 rm -f port-build/share/berrypy/.DS_Store
 find port-build/share/berrypy -name ".DS_Store" -delete
 
+# Move inline CSS/JS out of the templates into cacheable, content-hashed files
+echo "Building static assets..."
+python3 port-build/share/berrypy/build_assets.py port-build/share/berrypy
+rm -f port-build/share/berrypy/build_assets.py
+
 # Create documentation
 echo "Creating documentation..."
 cat > port-build/doc/README.md << 'DOCEOF'
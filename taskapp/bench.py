@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for BB10 Task Manager
+Runs taskapp.py pieces locally (no BB10 device needed) and prints timings.
+
+Usage:
+    python3 bench.py server     # requests/sec: single-threaded vs pooled server
+    python3 bench.py download   # streamed/resumed/parallel downloads vs read()
+    python3 bench.py catalog    # app-details lookups: json.loads per click vs CatalogIndex
+    python3 bench.py templates  # page render: read + str.replace vs CompiledTemplate
+    python3 bench.py keepalive  # icon fetches: new connection each vs HTTP/1.1 keep-alive
+    python3 bench.py processes  # process list per page: sample per renderer vs shared snapshot
+    python3 bench.py procfs     # enumeration: fork + parse pidin output vs incremental /proc scan
+    python3 bench.py ports      # port discovery per render: detect_app_port per app vs PortRegistry
+"""
+
+import hashlib
+import subprocess
+import http.client
+import http.server
+import json
+import os
+import re
+import shutil
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import taskapp
+
+
+class BenchHandler(taskapp.TaskManagerHandler):
+    """Task manager handler with a /slow route standing in for downloads and pidin"""
+
+    SLOW_SECONDS = 0.2
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(self.SLOW_SECONDS)
+            body = b'slow'
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain')
+            self.send_header('Content-Length', len(body))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_clients(port, paths, clients, duration):
+    """Hit the server from several client threads, return completed requests"""
+    done = [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client(index):
+        count = 0
+        while time.time() < deadline:
+            path = paths[(index + count) % len(paths)]
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            try:
+                conn.request('GET', path)
+                conn.getresponse().read()
+                count += 1
+            except Exception as e:
+                print(f"Client error: {e}")
+            finally:
+                conn.close()
+        with lock:
+            done[0] += count
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return done[0]
+
+
+def bench_server(duration=5.0, clients=8):
+    # One slow request in ten, the rest are cheap page loads
+    paths = ['/slow'] + ['/about'] * 9
+    servers = [
+        ('TCPServer (before)', lambda: socketserver.TCPServer(('127.0.0.1', 0), BenchHandler)),
+        (f'PooledTCPServer ({taskapp.SERVER_WORKERS} workers)',
+         lambda: taskapp.PooledTCPServer(('127.0.0.1', 0), BenchHandler)),
+    ]
+    print(f"{clients} clients, {duration:.0f}s each, 1 in {len(paths)} requests sleeps {BenchHandler.SLOW_SECONDS}s")
+    for label, factory in servers:
+        httpd = factory()
+        port = httpd.server_address[1]
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            completed = run_clients(port, paths, clients, duration)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        print(f"  {label:<32} {completed / duration:8.1f} req/s")
+
+
+class RangeFileHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Stand-in for berrystore: serves one in-memory blob with Range, If-Range
+    and ETag support, and can drop the connection halfway through.
+    """
+
+    blob = b''
+    etag = '"bench"'
+    drop_after = None  # Close the connection after this many bytes (once)
+    delay = 0.0  # Seconds to sleep per 64 KB, simulating a slow link
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', len(self.blob))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+
+    def do_GET(self):
+        start, end = 0, len(self.blob) - 1
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (if_range is None or if_range == self.etag):
+            first, _, last = range_header.split('=', 1)[1].partition('-')
+            start = int(first)
+            end = int(last) if last else end
+            if start >= len(self.blob):
+                self.send_response(416)
+                self.send_header('Content-Length', 0)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(self.blob)}')
+        else:
+            self.send_response(200)
+        body = memoryview(self.blob)[start:end + 1]
+        self.send_header('Content-Length', len(body))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        drop_after = RangeFileHandler.drop_after
+        if drop_after is not None:
+            RangeFileHandler.drop_after = None
+            body = body[:drop_after]
+        for i in range(0, len(body), 65536):
+            if self.delay:
+                time.sleep(self.delay)
+            self.wfile.write(body[i:i + 65536])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def old_download(url, path):
+    """install_app's download before streaming: whole zip in memory"""
+    with urllib.request.urlopen(url, timeout=10) as response:
+        data = response.read()
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def measure(label, func):
+    tracemalloc.start()
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<40} {elapsed * 1000:8.1f} ms   peak {peak / 1024:8.0f} KB")
+
+
+def bench_download(size=8 * 1024 * 1024):
+    RangeFileHandler.blob = os.urandom(size)
+    expected = hashlib.sha256(RangeFileHandler.blob).hexdigest()
+    httpd = taskapp.PooledTCPServer(('127.0.0.1', 0), RangeFileHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{httpd.server_address[1]}/package.zip'
+    workdir = tempfile.mkdtemp(prefix='berrypy-bench-')
+    dest = os.path.join(workdir, 'package.zip')
+
+    def check(label):
+        with open(dest, 'rb') as f:
+            ok = hashlib.sha256(f.read()).hexdigest() == expected
+        print(f"  {'':<40} {label}: {'sha256 OK' if ok else 'CORRUPT'}")
+        os.remove(dest)
+
+    print(f"{size // 1024} KB package from a local stand-in server")
+    try:
+        measure('response.read() (before)', lambda: old_download(url, dest))
+        check('read()')
+        measure('download_file, streamed', lambda: taskapp.download_file(url, dest))
+        check('streamed')
+
+        # Drop the connection halfway; download_file resumes with a Range request
+        RangeFileHandler.drop_after = size // 2
+        measure('download_file, dropped at 50%', lambda: taskapp.download_file(url, dest))
+        check('resumed')
+
+        # Leave a stale partial file from another version; If-Range restarts it
+        with open(dest + '.part', 'wb') as f:
+            f.write(b'x' * 1000)
+        with open(dest + '.part.validator', 'w') as f:
+            f.write('"other-version"')
+        measure('download_file, stale partial file', lambda: taskapp.download_file(url, dest))
+        check('restarted')
+
+        RangeFileHandler.delay = 0.005
+        measure('download_file, slow link, 1 part', lambda: taskapp.download_file(url, dest))
+        check('1 part')
+        measure('download_file, slow link, 4 parts', lambda: taskapp.download_file(url, dest, parts=4))
+        check('4 parts')
+    finally:
+        RangeFileHandler.delay = 0.0
+        httpd.shutdown()
+        httpd.server_close()
+        shutil.rmtree(workdir)
+
+
+def old_app_description(catalog_data, app_name):
+    """get_app_description before CatalogIndex: parse the whole catalog per click"""
+    catalog = json.loads(catalog_data)
+    if 'apps' in catalog and app_name in catalog['apps']:
+        return taskapp.render_catalog_description(catalog['apps'][app_name])
+    return f'<p>No description available for {app_name}.</p>'
+
+
+def bench_catalog(apps=2000, clicks=500):
+    catalog = {'apps': {}}
+    for i in range(apps):
+        catalog['apps'][f'app{i}'] = {
+            'name': f'App {i}',
+            'description': 'A BB10 app ' * 20,
+            'version': '1.0',
+            'author': 'SW7FT',
+            'category': 'Utility',
+            'icon': f'app{i}.png',
+            'requirements': ['flask', 'requests'],
+        }
+    catalog_data = json.dumps(catalog)
+    # Serve lookups from the in-memory cache, no network
+    taskapp.cache['catalog_cli'] = {'data': catalog_data, 'fetched': time.time(), 'accessed': time.time()}
+    names = [f'app{(i * 7919) % apps}' for i in range(clicks)]
+
+    print(f"{apps}-app catalog ({len(catalog_data) // 1024} KB), {clicks} app-details clicks")
+    start = time.time()
+    for name in names:
+        old_app_description(catalog_data, name)
+    old = (time.time() - start) / clicks
+    print(f"  {'json.loads per click (before)':<40} {old * 1000:8.3f} ms/click")
+
+    start = time.time()
+    index = taskapp.get_catalog_index('cli')
+    print(f"  {'CatalogIndex build (once per version)':<40} {(time.time() - start) * 1000:8.3f} ms")
+    start = time.time()
+    for name in names:
+        index = taskapp.get_catalog_index('cli')
+        index.descriptions.get(name)
+    new = (time.time() - start) / clicks
+    print(f"  {'CatalogIndex lookup':<40} {new * 1000:8.3f} ms/click")
+    same = all(old_app_description(catalog_data, n) == taskapp.get_catalog_index('cli').descriptions[n] for n in names[:50])
+    print(f"  {'':<40} output identical: {same}")
+    taskapp.cache.pop('catalog_cli', None)
+
+
+def old_render_main(values):
+    """generate_html's template handling before CompiledTemplate"""
+    with open(taskapp.HTML_TEMPLATE_PATH, 'r') as file:
+        html = file.read()
+    for slot, value in values.items():
+        html = html.replace(f'<!-- {slot} -->', value)
+    return html
+
+
+def bench_templates(renders=500):
+    card = '<div class="app-card"><div class="app-name">app</div></div>'
+    values = {
+        'manage_apps': card * 10,
+        'installed_apps': card * 30,
+        'available_cli_apps': '<div id="available-cli-loading">Loading CLI apps...</div>',
+        'available_web_apps': '<div id="available-web-loading">Loading web apps...</div>',
+    }
+    size = os.path.getsize(taskapp.HTML_TEMPLATE_PATH)
+    print(f"taskmgr.html ({size // 1024} KB), {renders} renders")
+
+    start = time.time()
+    for _ in range(renders):
+        old = old_render_main(values)
+    before = (time.time() - start) / renders
+    print(f"  {'read + str.replace (before)':<40} {before * 1000:8.3f} ms/render")
+
+    template = taskapp.TEMPLATES['main']
+    template.compile()
+    start = time.time()
+    for _ in range(renders):
+        new = template.render(**values)
+    after = (time.time() - start) / renders
+    print(f"  {'CompiledTemplate.render':<40} {after * 1000:8.3f} ms/render")
+    print(f"  {'':<40} output identical: {old == new}")
+
+
+def bench_keepalive(requests=300):
+    httpd = taskapp.PooledTCPServer(('127.0.0.1', 0), BenchHandler)
+    port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    icons = ['/app-icons/' + name for name in sorted(os.listdir(os.path.join(taskapp.BASE_DIR, 'app-icons'))) if name.endswith('.png')]
+    paths = [icons[i % len(icons)] for i in range(requests)]
+    print(f"{requests} icon requests from one client")
+    try:
+        start = time.time()
+        for path in paths:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            conn.request('GET', path)
+            conn.getresponse().read()
+            conn.close()
+        before = time.time() - start
+        print(f"  {'new connection per request (before)':<40} {requests / before:8.1f} req/s")
+
+        start = time.time()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        reconnects = 0
+        for path in paths:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.getheader('Connection') == 'close':
+                # Server hit KEEPALIVE_MAX_REQUESTS, open a fresh one
+                conn.close()
+                reconnects += 1
+        conn.close()
+        after = time.time() - start
+        print(f"  {'HTTP/1.1 keep-alive':<40} {requests / after:8.1f} req/s  ({reconnects} reconnects)")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def bench_processes(pages=200):
+    # /proc stands in for pidin here; a page used to sample once per renderer
+    backend = taskapp.ProcFsBackend()
+    renderers = 2  # generate_manage_apps_html and generate_processes_html
+    print(f"{pages} page loads, {renderers} process renderers each, {len(backend.sample())} processes")
+
+    start = time.time()
+    for _ in range(pages * renderers):
+        [p for p in (taskapp.filter_process(pid, cmd) for pid, cmd in backend.sample()) if p]
+    before = (time.time() - start) / pages
+    print(f"  {'sample per renderer (before)':<40} {before * 1000:8.3f} ms/page")
+
+    sampler = taskapp.ProcessSampler(backend)
+    start = time.time()
+    for _ in range(pages):
+        snapshots = {id(sampler.snapshot()) for _ in range(renderers)}
+    after = (time.time() - start) / pages
+    print(f"  {'shared ProcessSnapshot':<40} {after * 1000:8.3f} ms/page  (renderers agree: {len(snapshots) == 1})")
+
+
+def make_process_table(root, count):
+    """Write a synthetic /proc under root plus the matching pidin ar output"""
+    lines = ['     pid Arguments']
+    for i in range(count):
+        pid = str(1000 + i)
+        if i % 50 == 0:
+            cmd = ['python3', f'/data/apps/app{i}/app.py']
+        else:
+            cmd = [f'/usr/sbin/daemon{i}', '-d', '--config', f'/etc/daemon{i}.conf']
+        os.makedirs(os.path.join(root, pid))
+        with open(os.path.join(root, pid, 'cmdline'), 'wb') as f:
+            f.write(b'\0'.join(part.encode() for part in cmd) + b'\0')
+        lines.append(f'{pid:>8} {" ".join(cmd)}')
+    listing = os.path.join(root, 'pidin-ar.txt')
+    with open(listing, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return listing
+
+
+def bench_procfs(count=3000, scans=20):
+    root = tempfile.mkdtemp(prefix='berrypy-proc-')
+    try:
+        listing = make_process_table(root, count)
+        print(f"{count} synthetic processes, {scans} scans")
+
+        def relevant(raw):
+            return [p for p in (taskapp.filter_process(pid, cmd) for pid, cmd in raw) if p]
+
+        # pidin stand-in: fork/exec a child that prints the table, then parse it.
+        # Real pidin also has to walk every process, so this is a lower bound.
+        pidin = taskapp.PidinBackend()
+        start = time.time()
+        for _ in range(scans):
+            old = relevant(pidin.parse(subprocess.check_output(['cat', listing]).decode()))
+        before = (time.time() - start) / scans
+        print(f"  {'fork + parse pidin output (before)':<40} {before * 1000:8.3f} ms/scan")
+
+        start = time.time()
+        for _ in range(scans):
+            full = relevant(taskapp.ProcFsBackend(root).sample())
+        cold = (time.time() - start) / scans
+        print(f"  {'/proc scan, cold':<40} {cold * 1000:8.3f} ms/scan")
+
+        backend = taskapp.ProcFsBackend(root)
+        backend.sample()
+        backend.sample()  # New PIDs are confirmed on their second sighting
+        start = time.time()
+        for _ in range(scans):
+            new = relevant(backend.sample())
+        after = (time.time() - start) / scans
+        print(f"  {'/proc scan, incremental':<40} {after * 1000:8.3f} ms/scan")
+        print(f"  {'':<40} same processes: {sorted(old) == sorted(full) == sorted(new)} ({len(new)} relevant)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def old_detect_app_port(pid, app_name):
+    """detect_app_port before PortRegistry: every step per app, sequential probes"""
+    with open(os.path.join(taskapp.WEB_APPS_DIR, app_name, 'app.py')) as f:
+        content = f.read()
+    for pattern, _ in taskapp.PORT_PATTERNS:
+        match = re.search(pattern.pattern, content, re.IGNORECASE)
+        if match and 1024 <= int(match.group(1)) <= 65535:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(0.1)
+            result = sock.connect_ex(('127.0.0.1', int(match.group(1))))
+            sock.close()
+            if result == 0:
+                return int(match.group(1))
+    try:
+        lines = subprocess.check_output(['netstat', '-an'], timeout=5, stderr=subprocess.DEVNULL).decode().split('\n')
+    except Exception:
+        lines = []
+    web_ports = [p for p in taskapp.listening_ports(lines) if 8000 <= p <= 9000]
+    if web_ports:
+        return 8000 if 8000 in web_ports else min(web_ports)
+    listening = []
+    for port in taskapp.COMMON_WEB_PORTS:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(0.1)
+        if sock.connect_ex(('127.0.0.1', port)) == 0:
+            listening.append(port)
+        sock.close()
+    if listening:
+        return 8000 if 8000 in listening else min(listening)
+    return None
+
+
+def accept_forever(listener):
+    """Accept and drop connections, so probes never find a full backlog"""
+    try:
+        while True:
+            listener.accept()[0].close()
+    except OSError:
+        pass
+
+
+def bench_ports(apps=20, renders=10):
+    apps_dir = tempfile.mkdtemp(prefix='berrypy-apps-')
+    old_apps_dir = taskapp.WEB_APPS_DIR
+    listeners = []
+    try:
+        taskapp.WEB_APPS_DIR = apps_dir
+        wanted = []
+        for i in range(apps):
+            if i % 2 == 0:
+                # Half the apps are really listening on their declared port
+                listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listener.bind(('127.0.0.1', 0))
+                listener.listen(8)
+                listeners.append(listener)
+                threading.Thread(target=accept_forever, args=(listener,), daemon=True).start()
+                port = listener.getsockname()[1]
+            else:
+                # The rest declare a port nobody listens on, so detection falls through
+                port = 20000 + i
+            os.makedirs(os.path.join(apps_dir, f'app{i}'))
+            with open(os.path.join(apps_dir, f'app{i}', 'app.py'), 'w') as f:
+                f.write(f'PORT = {port}\n')
+            wanted.append((100000 + i, f'app{i}'))
+        print(f"{apps} running web apps without a known port, {renders} renders")
+
+        start = time.time()
+        for _ in range(renders):
+            old = {pid: old_detect_app_port(pid, name) for pid, name in wanted}
+        before = (time.time() - start) / renders
+        print(f"  {'detect_app_port per app (before)':<40} {before * 1000:8.3f} ms/render")
+
+        registry = taskapp.PortRegistry()
+        start = time.time()
+        for _ in range(renders):
+            new = registry.detect(wanted)
+        after = (time.time() - start) / renders
+        print(f"  {'PortRegistry.detect':<40} {after * 1000:8.3f} ms/render")
+        print(f"  {'':<40} same ports: {all(old[pid] == new.get(pid) for pid, _ in wanted)}")
+    finally:
+        taskapp.WEB_APPS_DIR = old_apps_dir
+        for listener in listeners:
+            listener.close()
+        shutil.rmtree(apps_dir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'server': bench_server,
+    'download': bench_download,
+    'catalog': bench_catalog,
+    'templates': bench_templates,
+    'keepalive': bench_keepalive,
+    'processes': bench_processes,
+    'procfs': bench_procfs,
+    'ports': bench_ports,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}")
+            print(f"Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        print(f"\n=== {name} ===")
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Static asset builder for BB10 Task Manager
+Pulls the inline <style> and <script> blocks out of the page templates,
+minifies them and writes them to static/ under content-hashed names, so
+the browser can cache them and page loads only transfer the dynamic HTML.
+
+Usage:
+    python3 build_assets.py [app_dir]
+
+app_dir defaults to this script's directory. Rewritten templates are
+written to app_dir/static/ next to the assets; taskapp.py prefers them
+over the originals as long as they are newer. build-port.sh runs this on
+the package copy.
+"""
+
+import hashlib
+import os
+import re
+import sys
+
+TEMPLATES = ['taskmgr.html', 'auto-config.html', 'android.html', 'about.html']
+STATIC_DIR_NAME = 'static'
+HASH_LENGTH = 10
+
+# Only plain inline blocks; <script src=...> is already external
+BLOCK_PATTERN = re.compile(r'<(style|script)>(.*?)</\1>', re.DOTALL)
+CSS_STRING_PATTERN = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+
+
+def minify_css(css):
+    """Drop comments and redundant whitespace, leaving quoted strings alone"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    parts = CSS_STRING_PATTERN.split(css)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[i])
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        part = re.sub(r':\s+', ':', part)
+        parts[i] = part.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(js):
+    """
+    Conservative JS minification: strip indentation, blank lines and
+    whole-line // comments. Line breaks are kept so automatic semicolon
+    insertion behaves exactly as before.
+    """
+    lines = []
+    for line in js.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def write_asset(static_dir, stem, kind, content):
+    """Write content as static/<stem>.<hash>.<ext> and return the file name"""
+    data = content.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    extension = 'css' if kind == 'style' else 'js'
+    name = f'{stem}.{digest}.{extension}'
+    path = os.path.join(static_dir, name)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return name
+
+
+def build_template(app_dir, static_dir, template_name):
+    """Extract one template's inline assets, return (assets written, bytes moved out)"""
+    template_path = os.path.join(app_dir, template_name)
+    with open(template_path, 'r', encoding='utf-8') as f:
+        html = f.read()
+
+    stem = os.path.splitext(template_name)[0]
+    assets = []
+
+    def extract(match):
+        kind, content = match.group(1), match.group(2)
+        if kind == 'style':
+            content = minify_css(content)
+        else:
+            content = minify_js(content)
+        if not content:
+            return ''
+        name = write_asset(static_dir, f'{stem}-{len(assets) + 1}', kind, content)
+        assets.append(name)
+        if kind == 'style':
+            return f'<link rel="stylesheet" href="/static/{name}">'
+        return f'<script src="/static/{name}"></script>'
+
+    built = BLOCK_PATTERN.sub(extract, html)
+    with open(os.path.join(static_dir, template_name), 'w', encoding='utf-8') as f:
+        f.write(built)
+    return assets, len(html.encode('utf-8')) - len(built.encode('utf-8'))
+
+
+def remove_stale_assets(static_dir, keep):
+    """Delete hashed assets from earlier builds that no template references"""
+    for name in os.listdir(static_dir):
+        if name.endswith(('.css', '.js')) and name not in keep:
+            os.remove(os.path.join(static_dir, name))
+
+
+def main():
+    app_dir = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(__file__))
+    static_dir = os.path.join(app_dir, STATIC_DIR_NAME)
+    os.makedirs(static_dir, exist_ok=True)
+
+    keep = set()
+    for template_name in TEMPLATES:
+        if not os.path.exists(os.path.join(app_dir, template_name)):
+            print(f"Skipping missing template: {template_name}")
+            continue
+        assets, saved = build_template(app_dir, static_dir, template_name)
+        keep.update(assets)
+        print(f"{template_name}: {len(assets)} assets, {saved // 1024} KB moved out of the page")
+    remove_stale_assets(static_dir, keep)
+    print(f"Static assets written to {static_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import http.client
 import http.server
 import socketserver
 import subprocess
@@ -12,6 +13,17 @@ import time
 import threading
 import socket
 import json
+import concurrent.futures
+import collections
+import uuid
+import hashlib
+import gzip
+import zlib
+import errno
+import select
+import array
+import selectors
+import shutil
 
 PORT = 8001
 BASE_DIR = os.path.dirname(__file__)
@@ -21,8 +33,24 @@ AUTO_CONFIG_TEMPLATE_PATH = os.path.join(BASE_DIR, 'auto-config.html')
 # New template paths
 ABOUT_TEMPLATE_PATH = os.path.join(BASE_DIR, 'about.html')
 ANDROID_TEMPLATE_PATH = os.path.join(BASE_DIR, 'android.html')
+# build_assets.py output: hashed CSS/JS plus templates that link to them
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+STATIC_MAX_AGE = 365 * 24 * 3600  # Hashed names change with content, cache for a year
+ICON_MAX_AGE = 24 * 3600
+
+# Response compression (gzip/deflate, negotiated from Accept-Encoding)
+COMPRESS_MIN_SIZE = 512  # Smaller bodies are sent as-is
+COMPRESS_MIN_SAVING = 0.1  # Send compressed only if it saves at least 10%
+COMPRESS_LEVEL = 6  # Dynamic bodies when the server is idle
+COMPRESS_LEVEL_LARGE = 4  # Dynamic bodies over COMPRESS_LARGE_SIZE
+COMPRESS_LEVEL_BUSY = 1  # Dynamic bodies while most workers are busy
+COMPRESS_LARGE_SIZE = 256 * 1024
+COMPRESS_VARIANT_LEVEL = 9  # Precompressed static variants, paid once
+COMPRESS_MAX_VARIANTS = 256
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
 
 CLI_APPS_DIR = os.path.expanduser('~/usr/local/bin')  # CLI apps directory
+CLI_LIB_DIR = os.path.expanduser('~/usr/local/lib')  # lib/ members of CLI packages
 WEB_APPS_DIR = os.path.expanduser('~/apps')           # Web apps directory
 AVAILABLE_APPS_URL = 'http://berrystore.sw7ft.com/bins/'
 WEB_APPS_URL = 'http://berrystore.sw7ft.com/apps/'
@@ -30,46 +58,2955 @@ WEB_APPS_URL = 'http://berrystore.sw7ft.com/apps/'
 APKS_URL = 'http://berrystore.sw7ft.com/apks/'
 
 PROFILE_FILE = os.path.expanduser('~/.profile')
-app_ports = {}  # Store mapping of PID to port
+BERRYPY_DATA_DIR = os.path.expanduser('~/.berrypy')  # BerryPy's own state
+DOWNLOAD_DIR = os.path.join(BERRYPY_DATA_DIR, 'downloads')  # Partial and pending package downloads
+app_ports = {}  # PID -> port, kept in step with port_allocator's leases
 
 # Performance optimization: Caching
 CACHE_DURATION = 300  # 5 minutes cache
 REQUEST_TIMEOUT = 10  # 10 seconds timeout
-APPS_CACHE_DURATION = 60  # 1 minute cache for installed apps
+HTTP_CACHE_DIR = os.path.join(BERRYPY_DATA_DIR, 'http-cache')  # Store listings and catalogs across restarts
+HTTP_CACHE_MAX_BYTES = 2 * 1024 * 1024  # Disk budget for HTTP_CACHE_DIR
 cache = {}
-apps_cache = {}
+revalidating = set()  # Cache keys with a background revalidation in flight
+
+# Concurrency: requests are served by a bounded pool of worker threads, so the
+# shared caches above are guarded by locks
+SERVER_WORKERS = 8  # Max requests handled at the same time
+SERVER_BACKLOG = 32  # Pending connections queued by the kernel when all workers are busy
+# HTTP/1.1 keep-alive: an idle persistent connection still occupies a worker,
+# so only some of them may stay open and they time out quickly. Together with
+# SSE_MAX_STREAMS and LOG_MAX_FOLLOWERS this must stay below SERVER_WORKERS,
+# or parked connections can take every worker
+KEEPALIVE_MAX_CONNECTIONS = 3
+KEEPALIVE_IDLE_TIMEOUT = 10  # Seconds a kept-alive connection may sit idle
+KEEPALIVE_MAX_REQUESTS = 100  # Requests served before a connection is closed
+cache_lock = threading.Lock()
+app_ports_lock = threading.Lock()
+
+# Background jobs: /action work runs off the request thread, with a
+# concurrency limit per action type
+JOB_LIMITS = {
+    'install': 2,
+    'delete': 2,
+    'start': 2,
+    'stop': 4,
+    'enable_auto_start': 1,
+    'disable_auto_start': 1,
+    'batch': 2,
+    'control': 2,
+    'upgrade': 1,
+}
+JOB_HISTORY = 50  # Finished jobs kept around for /api/jobs
+BATCH_PARALLELISM = 3  # Default apps handled at once by /api/batch
+BATCH_MAX_PARALLELISM = 6
+
+# Stopping apps: SIGTERM, then SIGKILL if they are still there after the grace period
+STOP_GRACE_PERIOD = 5  # Default seconds between SIGTERM and SIGKILL (app setting stop_grace overrides)
+STOP_KILL_WAIT = 2  # Seconds to wait for the exit after SIGKILL
+CONTROL_MAX_PARALLELISM = 16  # Targets /api/control signals at once
+
+# Process list: sampled in the background and shared by every renderer
+PROCESS_BACKEND = None  # 'pidin', 'proc', or None to pick one for this system
+PROCESS_SAMPLE_INTERVAL = 2.0  # Seconds a snapshot stays current
+PROCESS_SAMPLER_IDLE = 30  # Background sampling pauses when nobody asked for this long
+
+# Per-process CPU/memory history, recorded with every process snapshot
+METRICS_HISTORY = 300  # Samples kept per process (10 minutes at the default interval)
+METRICS_POINTS = 60  # Points /api/metrics returns unless ?points= asks for another count
+SPARKLINE_POINTS = 30  # Most recent samples drawn on a process card
+
+# Live updates over Server-Sent Events (/api/events)
+SSE_MAX_STREAMS = 2  # Each open stream holds one of the SERVER_WORKERS threads
+SSE_STREAM_SECONDS = 300  # Streams are closed after this; EventSource reconnects by itself
+SSE_RETRY_MS = 3000  # Reconnect delay suggested to the browser
+SSE_QUEUE_LIMIT = 200  # Events buffered per stream before it is told to reload instead
+JOB_EVENT_INTERVAL = 0.25  # Minimum seconds between progress events for one job
+
+# Output of launched apps, drained by one selector thread into rotating files
+LOG_DIR = os.path.join(BERRYPY_DATA_DIR, 'logs')
+LOG_MAX_BYTES = 256 * 1024  # Size of <app>.log before it is rotated
+LOG_BACKUPS = 2  # Rotated files kept per app (<app>.log.1, <app>.log.2)
+LOG_READ_SIZE = 64 * 1024  # Max bytes read from a pipe, or returned by /api/logs, at once
+LOG_TAIL_BYTES = 16 * 1024  # /api/logs/<app> returns this much of the end by default
+LOG_FOLLOW_TIMEOUT = 20  # Seconds a follow request waits for new output
+LOG_MAX_FOLLOWERS = 2  # Follow requests waiting at once (each holds a worker thread)
+
+# Supervisor: restarts launched apps that exit, according to a per-app policy
+APP_SETTINGS_FILE = os.path.join(BERRYPY_DATA_DIR, 'app-settings.json')  # Per-app options such as restart policy
+RESTART_POLICIES = ('never', 'on-failure', 'always')
+DEFAULT_RESTART_POLICY = 'never'  # Supervision is opt-in per app
+SUPERVISOR_INTERVAL = 1.0  # Seconds between checks for exited apps
+RESTART_BACKOFF_INITIAL = 1.0  # Delay before the first restart, doubled after each one
+RESTART_BACKOFF_MAX = 60.0
+RESTART_STABLE_AFTER = 60  # An app that ran this long gets its backoff reset when it exits
+CRASH_LOOP_RESTARTS = 5  # This many restarts within CRASH_LOOP_WINDOW seconds...
+CRASH_LOOP_WINDOW = 120  # ...is a crash loop: the supervisor gives up until the app is started again
+
+# Package database: what each install wrote, so uninstalls remove exactly that
+PACKAGE_DB_FILE = os.path.join(BERRYPY_DATA_DIR, 'packages.json')  # Manifest, version, size and time per install
+
+# Downloaded package zips are kept by SHA-256, so reinstalls and rollbacks work offline
+PACKAGE_CACHE_DIR = os.path.join(BERRYPY_DATA_DIR, 'package-cache')
+PACKAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Least recently used zips are evicted beyond this
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Packages are extracted into a staging directory next to their destination
+# and renamed into place, so a failed install leaves the old files untouched
+EXTRACT_CHUNK_SIZE = 64 * 1024  # Members are streamed out of the zip in pieces this size
+EXTRACT_WORKERS = 1  # Set > 1 to extract packages of many small files on several threads
+
+# Readiness: after launch, a web app is polled until it accepts connections
+READY_TIMEOUT = 15  # Seconds a web app gets to start accepting connections
+READY_POLL_INITIAL = 0.05  # First delay between probes, doubled after each one...
+READY_POLL_MAX = 0.5  # ...up to this, which also bounds how far the measured latency can overshoot
+READY_HISTORY = 20  # Startup measurements kept per app
+
+# Port discovery for running web apps
+PORT_PROBE_TIMEOUT = 0.1  # Seconds to wait for one round of concurrent connect probes
+PORT_NETSTAT_TTL = PROCESS_SAMPLE_INTERVAL  # One netstat snapshot is shared for this long
+COMMON_WEB_PORTS = [8000, 8080, 8001, 8002, 8003, 8004, 8005, 8006, 8007, 8008, 8009, 8010]
+PORT_PATTERNS = [
+    (re.compile(r'PORT\s*=\s*(\d+)', re.IGNORECASE), 'PORT constant'),
+    (re.compile(r'port\s*=\s*(\d+)', re.IGNORECASE), 'port variable'),
+    (re.compile(r'server_address\s*=\s*\([^,]+,\s*(\d+)\)', re.IGNORECASE), 'server_address tuple'),
+    (re.compile(r'HTTPServer\(\s*\([^,]+,\s*(\d+)\)', re.IGNORECASE), 'HTTPServer tuple'),
+    (re.compile(r'app\.run\([^)]*port\s*=\s*(\d+)', re.IGNORECASE), 'app.run'),
+    (re.compile(r'TCPServer\([^)]*(\d+)\)', re.IGNORECASE), 'TCPServer'),
+]
+
+# Port leases: every launched web app holds its port in one table, so two apps
+# declaring the same port are caught before the second one starts
+PORT_ASSIGN_RANGE = (8100, 8199)  # Free ports handed to apps that read PORT/BERRYPY_PORT
+
+# Package downloads are streamed to disk in chunks and resumed with Range requests
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_RETRIES = 3  # Resume attempts after a dropped connection
+DOWNLOAD_PARTS = 1  # Set > 1 to fetch large zips as parallel byte ranges
+DOWNLOAD_PARTS_MIN_SIZE = 4 * 1024 * 1024  # Only split downloads bigger than this
 
 def get_cached_or_fetch(url, cache_key):
-    """Get data from cache or fetch from URL with timeout"""
-    current_time = time.time()
-    
-    # Check if we have cached data that's still valid
-    if cache_key in cache:
-        cached_time, cached_data = cache[cache_key]
-        if current_time - cached_time < CACHE_DURATION:
-            return cached_data
-    
-    # Fetch new data with timeout
+    """
+    Get data from cache or fetch from URL with timeout.
+    Responses are kept in memory and on disk (HTTP_CACHE_DIR) along with
+    their ETag/Last-Modified, so they survive restarts. Once older than
+    CACHE_DURATION the cached copy is still returned right away while a
+    background thread revalidates it with a conditional request.
+    """
+    with cache_lock:
+        entry = cache.get(cache_key)
+    if entry is None:
+        entry = load_cache_entry(cache_key)
+
+    if entry is None:
+        # Nothing cached anywhere: fetch now, once even if several requests miss together
+        with fetch_locks.get(cache_key):
+            with cache_lock:
+                entry = cache.get(cache_key)
+            if entry is None:
+                entry = fetch_into_cache(url, cache_key, None)
+        return entry['data'] if entry else None
+
+    entry['accessed'] = time.time()
+    if time.time() - entry['fetched'] >= CACHE_DURATION:
+        revalidate_in_background(url, cache_key, entry)
+    return entry['data']
+
+def fetch_into_cache(url, cache_key, entry):
+    """
+    Fetch url, sending the cached entry's validators if there is one.
+    A 304 just refreshes the entry's timestamp. Returns the current entry,
+    or the stale one (possibly None) when the fetch fails.
+    """
+    headers = {}
+    body_changed = True
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
     try:
-        request = urllib.request.Request(url)
+        request = urllib.request.Request(url, headers=headers)
         with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
             if response.status != 200:
                 print(f"Failed to fetch {url}: Status {response.status}")
-                return None
+                return entry
             data = response.read().decode()
-            # Cache the result
-            cache[cache_key] = (current_time, data)
-            return data
+            now = time.time()
+            entry = {
+                'url': url,
+                'data': data,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched': now,
+                'accessed': now,
+                'size': len(data),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and entry:
+            # Not modified: the cached copy is good for another CACHE_DURATION
+            entry['fetched'] = time.time()
+            body_changed = False
+        else:
+            print(f"Error fetching {url}: {e}")
+            if entry:
+                print(f"Using stale cache for {cache_key}")
+            return entry
     except (urllib.error.URLError, socket.timeout) as e:
         print(f"Error fetching {url}: {e}")
         # Return stale cache if available
-        if cache_key in cache:
-            cached_time, cached_data = cache[cache_key]
+        if entry:
             print(f"Using stale cache for {cache_key}")
-            return cached_data
+        return entry
+
+    with cache_lock:
+        cache[cache_key] = entry
+    save_cache_entry(cache_key, entry, body_changed)
+    return entry
+
+def revalidate_in_background(url, cache_key, entry):
+    """Start a conditional refetch of a stale entry unless one is already running"""
+    with cache_lock:
+        if cache_key in revalidating:
+            return
+        revalidating.add(cache_key)
+
+    def revalidate():
+        try:
+            fetch_into_cache(url, cache_key, entry)
+        finally:
+            with cache_lock:
+                revalidating.discard(cache_key)
+
+    threading.Thread(target=revalidate, name=f'berrypy-revalidate-{cache_key}', daemon=True).start()
+
+def cache_entry_path(cache_key):
+    safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', cache_key)
+    return os.path.join(HTTP_CACHE_DIR, safe_key)
+
+def load_cache_entry(cache_key):
+    """Load an entry saved by a previous run into the memory cache, or return None"""
+    path = cache_entry_path(cache_key)
+    try:
+        with open(path + '.json', 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        with open(path + '.body', 'r', encoding='utf-8') as f:
+            entry['data'] = f.read()
+    except (OSError, ValueError):
+        return None
+    entry['accessed'] = time.time()
+    with cache_lock:
+        # Another thread may have loaded or fetched it meanwhile
+        entry = cache.setdefault(cache_key, entry)
+    return entry
+
+def save_cache_entry(cache_key, entry, write_body=True):
+    """Write an entry to HTTP_CACHE_DIR, then enforce the size cap"""
+    path = cache_entry_path(cache_key)
+    meta = {k: v for k, v in entry.items() if k != 'data'}
+    try:
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        body_path = path + '.body'
+        if write_body or not os.path.exists(body_path):
+            with open(body_path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(entry['data'])
+            os.replace(body_path + '.tmp', body_path)
+        with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(path + '.json.tmp', path + '.json')
+    except OSError as e:
+        print(f"Error saving {cache_key} to disk cache: {e}")
+        return
+    evict_cache_entries()
+
+def evict_cache_entries():
+    """Drop least recently used entries until the disk cache fits HTTP_CACHE_MAX_BYTES"""
+    try:
+        names = [n[:-len('.json')] for n in os.listdir(HTTP_CACHE_DIR) if n.endswith('.json')]
+    except OSError:
+        return
+    entries = []
+    total = 0
+    for name in names:
+        path = os.path.join(HTTP_CACHE_DIR, name)
+        try:
+            size = os.path.getsize(path + '.body')
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                accessed = json.load(f).get('accessed', 0)
+        except (OSError, ValueError):
+            size, accessed = 0, 0
+        with cache_lock:
+            entry = cache.get(name)
+        if entry:
+            accessed = entry.get('accessed', accessed)
+        entries.append((accessed, name, size))
+        total += size
+
+    entries.sort()
+    for accessed, name, size in entries:
+        if total <= HTTP_CACHE_MAX_BYTES:
+            break
+        print(f"Evicting {name} from disk cache")
+        for suffix in ('.json', '.body'):
+            try:
+                os.remove(os.path.join(HTTP_CACHE_DIR, name + suffix))
+            except OSError:
+                pass
+        with cache_lock:
+            cache.pop(name, None)
+        total -= size
+
+class CompiledTemplate:
+    """
+    An HTML template split once into static segments and named
+    <!-- slot --> markers, so rendering is a single join instead of a
+    str.replace pass per slot. The file is re-read only when its mtime
+    changes.
+    """
+
+    def __init__(self, path, slots=()):
+        self.path = path
+        self.built_path = os.path.join(STATIC_DIR, os.path.basename(path))
+        self.slots = tuple(slots)
+        self.lock = threading.Lock()
+        self.version = None  # (path, mtime) the parts were compiled from
+        self.parts = []
+        self.slot_positions = []  # (index in parts, slot name)
+
+    def current_source(self):
+        """
+        (path, mtime) of the file to render: the build_assets.py version
+        when it is at least as new as the original, else the original
+        """
+        mtime = os.stat(self.path).st_mtime
+        try:
+            built_mtime = os.stat(self.built_path).st_mtime
+        except OSError:
+            return self.path, mtime
+        if built_mtime >= mtime:
+            return self.built_path, built_mtime
+        return self.path, mtime
+
+    def compile(self):
+        version = self.current_source()
+        with open(version[0], 'r') as file:
+            html = file.read()
+        parts = [html]
+        slot_positions = []
+        if self.slots:
+            pattern = '<!-- (' + '|'.join(re.escape(slot) for slot in self.slots) + ') -->'
+            # re.split with a group alternates static text and slot names
+            parts = re.split(pattern, html)
+            slot_positions = [(i, parts[i]) for i in range(1, len(parts), 2)]
+        with self.lock:
+            self.parts = parts
+            self.slot_positions = slot_positions
+            self.version = version
+        print(f"Compiled template {os.path.relpath(version[0], BASE_DIR)} ({len(slot_positions)} slots)")
+
+    def render(self, **values):
+        """Fill the slots (missing ones render empty) and return the page"""
+        if self.current_source() != self.version:
+            self.compile()
+        with self.lock:
+            parts = list(self.parts)
+            slot_positions = self.slot_positions
+        for index, slot in slot_positions:
+            parts[index] = values.get(slot) or ''
+        return ''.join(parts)
+
+TEMPLATES = {
+    'main': CompiledTemplate(HTML_TEMPLATE_PATH,
+                             ('manage_apps', 'installed_apps', 'available_cli_apps', 'available_web_apps')),
+    'auto_config': CompiledTemplate(AUTO_CONFIG_TEMPLATE_PATH, ('installed_apps_auto',)),
+    'android': CompiledTemplate(ANDROID_TEMPLATE_PATH, ('apks_list',)),
+    'about': CompiledTemplate(ABOUT_TEMPLATE_PATH),
+}
+
+def compile_templates():
+    """Compile every page template up front (also done lazily on first render)"""
+    for template in TEMPLATES.values():
+        try:
+            template.compile()
+        except OSError as e:
+            print(f"Error compiling template {template.path}: {e}")
+
+static_assets = {}  # path -> (mtime, etag, data)
+static_assets_lock = threading.Lock()
+
+STATIC_CONTENT_TYPES = {
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+}
+
+def load_static_asset(directory, name):
+    """
+    Return (etag, data) for a file in directory, kept in memory until its
+    mtime changes, or None if it does not exist. Hashed build_assets.py
+    names (name.<hash>.ext) use the hash as the ETag.
+    """
+    path = os.path.join(directory, os.path.basename(name))
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
         return None
+    with static_assets_lock:
+        cached = static_assets.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    parts = os.path.basename(path).split('.')
+    if len(parts) >= 3 and directory == STATIC_DIR:
+        etag = f'"{parts[-2]}"'
+    else:
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+    with static_assets_lock:
+        static_assets[path] = (mtime, etag, data)
+    return etag, data
+
+compressed_variants = {}  # (variant_key, encoding) -> compressed bytes, or None if not worth it
+compressed_variants_lock = threading.Lock()
+compression_stats = {}  # route -> {'responses', 'compressed', 'raw_bytes', 'sent_bytes'}
+compression_stats_lock = threading.Lock()
+
+def choose_encoding(accept_encoding):
+    """Pick gzip or deflate from an Accept-Encoding header (q-values honoured), or None"""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    best, best_q = None, 0.0
+    for encoding in ('gzip', 'deflate'):
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def compress_bytes(data, encoding, level):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zlib.compress(data, level)
+
+def compress_body(data, encoding, variant_key=None, busy=False):
+    """
+    Compress data for the chosen encoding. Bodies with a variant_key never
+    change for that key, so they are compressed once at the highest level
+    and kept in memory; other bodies get a level chosen from their size and
+    the server load. Returns None when compression does not pay off.
+    """
+    if variant_key is not None:
+        with compressed_variants_lock:
+            if (variant_key, encoding) in compressed_variants:
+                return compressed_variants[(variant_key, encoding)]
+        level = COMPRESS_VARIANT_LEVEL
+    elif busy:
+        level = COMPRESS_LEVEL_BUSY
+    elif len(data) > COMPRESS_LARGE_SIZE:
+        level = COMPRESS_LEVEL_LARGE
+    else:
+        level = COMPRESS_LEVEL
+
+    compressed = compress_bytes(data, encoding, level)
+    if len(compressed) > len(data) * (1 - COMPRESS_MIN_SAVING):
+        compressed = None
+    if variant_key is not None:
+        with compressed_variants_lock:
+            if len(compressed_variants) >= COMPRESS_MAX_VARIANTS:
+                compressed_variants.clear()
+            compressed_variants[(variant_key, encoding)] = compressed
+    return compressed
+
+def record_compression(route, raw_bytes, sent_bytes):
+    with compression_stats_lock:
+        stats = compression_stats.setdefault(route, {'responses': 0, 'compressed': 0, 'raw_bytes': 0, 'sent_bytes': 0})
+        stats['responses'] += 1
+        stats['raw_bytes'] += raw_bytes
+        stats['sent_bytes'] += sent_bytes
+        if sent_bytes < raw_bytes:
+            stats['compressed'] += 1
+
+def compression_report():
+    """Per-route byte savings for /api/compression-stats"""
+    with compression_stats_lock:
+        routes = {route: dict(stats) for route, stats in compression_stats.items()}
+    total_raw = total_sent = 0
+    for stats in routes.values():
+        stats['saved_bytes'] = stats['raw_bytes'] - stats['sent_bytes']
+        stats['saved_percent'] = round(100.0 * stats['saved_bytes'] / stats['raw_bytes'], 1) if stats['raw_bytes'] else 0.0
+        total_raw += stats['raw_bytes']
+        total_sent += stats['sent_bytes']
+    return {
+        'routes': routes,
+        'raw_bytes': total_raw,
+        'sent_bytes': total_sent,
+        'saved_percent': round(100.0 * (total_raw - total_sent) / total_raw, 1) if total_raw else 0.0,
+    }
+
+def route_label(path):
+    """Group request paths into routes for the compression report"""
+    path = urllib.parse.urlparse(path).path
+    for prefix in ('/app-icons/', '/static/', '/api/jobs/'):
+        if path.startswith(prefix):
+            return prefix + '*'
+    return path
+
+class CatalogIndex:
+    """
+    A decoded catalog.json: app entries by name plus the icon and
+    description HTML the store pages need, rendered once per catalog
+    version instead of on every click.
+    """
+
+    def __init__(self, source):
+        self.source = source  # Catalog text this index was built from
+        try:
+            apps = json.loads(source).get('apps', {})
+        except (ValueError, AttributeError) as e:
+            print(f"Error parsing catalog.json: {e}")
+            apps = {}
+        self.apps = apps if isinstance(apps, dict) else {}
+        self.icons = {}
+        self.descriptions = {}
+        for app_name, app_info in self.apps.items():
+            if not isinstance(app_info, dict):
+                continue
+            if 'icon' in app_info:
+                icon_file = app_info['icon']
+                self.icons[app_name] = f'<img src="/app-icons/{icon_file}" width="48" height="48" alt="{app_name}" onerror="this.outerHTML=\'<div class=&quot;app-icon-text&quot;>{app_name[0].upper()}</div>\'">'
+            self.descriptions[app_name] = render_catalog_description(app_info)
+
+    def icon_html(self, app_name):
+        """Icon <img> from the catalog, or the first-letter fallback"""
+        icon = self.icons.get(app_name)
+        if icon is None:
+            icon = f'<div class="app-icon-text">{app_name[0].upper()}</div>'
+        return icon
+
+def render_catalog_description(app_info):
+    """Build the details modal HTML for one catalog entry"""
+    html = '<div class="app-description">'
+    if 'name' in app_info:
+        html += f'<h3>{app_info["name"]}</h3>'
+    if 'description' in app_info:
+        html += f'<p>{app_info["description"]}</p>'
+    if 'version' in app_info:
+        html += f'<p><strong>Version:</strong> {app_info["version"]}</p>'
+    if 'author' in app_info:
+        html += f'<p><strong>Author:</strong> {app_info["author"]}</p>'
+    if 'category' in app_info:
+        html += f'<p><strong>Category:</strong> {app_info["category"]}</p>'
+    if 'requirements' in app_info and app_info['requirements']:
+        html += '<div class="app-requirements">'
+        html += '<p><strong>Python Requirements:</strong></p>'
+        html += '<p style="font-size: 12px; color: #aaa;">Install with:</p>'
+        html += '<pre style="background: #1a1a1a; padding: 10px; border-radius: 4px; overflow-x: auto;">'
+        for req in app_info['requirements']:
+            html += f'python3 -m pip install {req}\n'
+        html += '</pre>'
+        html += '</div>'
+    html += '</div>'
+    return html
+
+catalog_indexes = {}  # app_type -> CatalogIndex
+catalog_indexes_lock = threading.Lock()
+
+def get_catalog_index(app_type):
+    """
+    Return the CatalogIndex for the 'cli' or 'web' store, or None if the
+    catalog cannot be fetched. The index is rebuilt only when the cached
+    catalog text changes.
+    """
+    store_url = AVAILABLE_APPS_URL if app_type == 'cli' else WEB_APPS_URL
+    catalog_data = get_cached_or_fetch(urllib.parse.urljoin(store_url, 'catalog.json'), f'catalog_{app_type}')
+    if catalog_data is None:
+        return None
+
+    with catalog_indexes_lock:
+        index = catalog_indexes.get(app_type)
+    if index is not None:
+        # A 304 revalidation keeps the same string; a 200 with identical bytes does not
+        if index.source is catalog_data:
+            return index
+        if index.source == catalog_data:
+            index.source = catalog_data
+            return index
+
+    index = CatalogIndex(catalog_data)
+    with catalog_indexes_lock:
+        catalog_indexes[app_type] = index
+    print(f"Indexed {len(index.apps)} apps from the {app_type} catalog")
+    return index
+
+class KeyedLocks:
+    """One lock per key, created on first use"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    def get(self, key):
+        with self.lock:
+            lock = self.locks.get(key)
+            if lock is None:
+                lock = self.locks[key] = threading.Lock()
+            return lock
+
+fetch_locks = KeyedLocks()  # Single-flight fetches per cache key
+directory_locks = KeyedLocks()  # Serialize extraction and deletion per install directory
+
+class DownloadError(Exception):
+    """Raised when a package download fails after all retries"""
+
+def download_file(url, dest_path, progress=None, parts=DOWNLOAD_PARTS):
+    """
+    Stream url to dest_path in DOWNLOAD_CHUNK_SIZE chunks. Data goes to
+    dest_path + '.part' first; an interrupted transfer (dropped connection or
+    BerryPy restart) is resumed with a Range request. With parts > 1, large
+    files that the server can serve in ranges are fetched as parallel byte
+    ranges. progress(done_bytes, total_bytes) is called as data arrives;
+    total_bytes is None when the server does not send a length.
+    """
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    part_path = dest_path + '.part'
+
+    if parts > 1:
+        size = probe_download(url)
+        if size and size >= DOWNLOAD_PARTS_MIN_SIZE:
+            download_ranges(url, part_path, size, parts, progress)
+            os.replace(part_path, dest_path)
+            remove_download_validator(part_path)
+            return dest_path
+
+    last_error = None
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            # Only resume if the file on the server is still the one we started
+            validator = read_download_validator(part_path)
+            if validator:
+                headers['If-Range'] = validator
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                if offset and response.status == 206:
+                    print(f"Resuming {url} at {offset} bytes")
+                    mode = 'ab'
+                else:
+                    offset = 0
+                    mode = 'wb'
+                    write_download_validator(part_path, response.headers)
+                length = response.headers.get('Content-Length')
+                total = offset + int(length) if length else None
+                with open(part_path, mode) as f:
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        offset += len(chunk)
+                        if progress:
+                            progress(offset, total)
+                if total is not None and offset < total:
+                    raise http.client.IncompleteRead(b'', total - offset)
+            os.replace(part_path, dest_path)
+            remove_download_validator(part_path)
+            return dest_path
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Partial file no longer matches the server, start over
+                os.remove(part_path)
+                last_error = e
+                continue
+            raise DownloadError(f"Failed to download {url}: Status {e.code}")
+        except (urllib.error.URLError, socket.timeout, http.client.HTTPException, ConnectionError) as e:
+            last_error = e
+            print(f"Download of {url} interrupted ({e}), attempt {attempt + 1} of {DOWNLOAD_RETRIES + 1}")
+    raise DownloadError(f"Failed to download {url}: {last_error}")
+
+def probe_download(url):
+    """HEAD url, return its size if it can be fetched in byte ranges, else None"""
+    try:
+        request = urllib.request.Request(url, method='HEAD')
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+                return None
+            length = response.headers.get('Content-Length')
+            return int(length) if length else None
+    except (urllib.error.URLError, socket.timeout, http.client.HTTPException, ValueError) as e:
+        print(f"Could not probe {url}: {e}")
+        return None
+
+def download_ranges(url, part_path, size, parts, progress=None):
+    """Fetch size bytes of url into part_path as parts parallel byte ranges"""
+    with open(part_path, 'wb') as f:
+        f.truncate(size)
+    step = -(-size // parts)
+    ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+    done = [0]
+    lock = threading.Lock()
+
+    def fetch_range(start, end):
+        position = start
+        last_error = None
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                request = urllib.request.Request(url, headers={'Range': f'bytes={position}-{end}'})
+                with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                    if response.status != 206:
+                        raise DownloadError(f"Server ignored range request for {url}")
+                    with open(part_path, 'r+b') as f:
+                        f.seek(position)
+                        while position <= end:
+                            chunk = response.read(min(DOWNLOAD_CHUNK_SIZE, end - position + 1))
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            position += len(chunk)
+                            with lock:
+                                done[0] += len(chunk)
+                                if progress:
+                                    progress(done[0], size)
+                if position > end:
+                    return
+                last_error = http.client.IncompleteRead(b'', end - position + 1)
+            except (urllib.error.URLError, socket.timeout, http.client.HTTPException, ConnectionError) as e:
+                last_error = e
+        raise DownloadError(f"Failed to download bytes {start}-{end} of {url}: {last_error}")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parts, thread_name_prefix='berrypy-range') as executor:
+        futures = [executor.submit(fetch_range, start, end) for start, end in ranges]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            os.remove(part_path)
+            raise
+
+def read_download_validator(part_path):
+    try:
+        with open(part_path + '.validator', 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_download_validator(part_path, headers):
+    # Remember the ETag (or Last-Modified) so a resume can send If-Range
+    validator = headers.get('ETag') or headers.get('Last-Modified')
+    if validator:
+        with open(part_path + '.validator', 'w') as f:
+            f.write(validator)
+    else:
+        remove_download_validator(part_path)
+
+def remove_download_validator(part_path):
+    try:
+        os.remove(part_path + '.validator')
+    except OSError:
+        pass
+
+class Job:
+    """State of one background action, as reported by /api/jobs/<id>"""
+
+    def __init__(self, action, target):
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.target = target
+        self.state = 'queued'  # queued -> running -> done | failed
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+        self.published = 0  # When the last progress event went out
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'target': self.target,
+            'state': self.state,
+            'progress': round(self.progress, 3),
+            'message': self.message,
+            'error': self.error,
+            'result': self.result,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+class JobManager:
+    """
+    Runs actions on per-action thread pools so each action type has its own
+    concurrency limit (e.g. at most 2 installs downloading at once).
+    """
+
+    def __init__(self, limits, history=JOB_HISTORY):
+        self.limits = limits
+        self.history = history
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()
+        self.executors = {}
+
+    def executor_for(self, action):
+        with self.lock:
+            executor = self.executors.get(action)
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.limits.get(action, 1), thread_name_prefix=f'berrypy-{action}')
+                self.executors[action] = executor
+            return executor
+
+    def submit(self, action, target, func, *args):
+        """Queue func(*args) as a job and return the Job right away"""
+        job = Job(action, target)
+        with self.lock:
+            self.jobs[job.id] = job
+            self.prune()
+        self.executor_for(action).submit(self.run, job, func, args)
+        return job
+
+    def run(self, job, func, args):
+        job.state = 'running'
+        job.started = time.time()
+        job.message = 'Running'
+        publish_job(job)
+        job_context.job = job
+        try:
+            result = func(*args)
+            if result is not None:
+                job.result = result
+        except Exception as e:
+            print(f"Job {job.id} ({job.action} {job.target}) crashed: {e}")
+            job.error = str(e)
+        finally:
+            job_context.job = None
+        job.finished = time.time()
+        if job.error:
+            job.state = 'failed'
+            job.message = 'Failed'
+        else:
+            job.state = 'done'
+            job.progress = 1.0
+            job.message = 'Done'
+        job.done.set()
+        publish_job(job)
+
+    def prune(self):
+        # Drop the oldest finished jobs once the history is full (lock held)
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+job_context = threading.local()
+jobs = JobManager(JOB_LIMITS)
+
+class EventSubscription:
+    """Events waiting to be written to one /api/events stream"""
+
+    def __init__(self, limit=SSE_QUEUE_LIMIT):
+        self.limit = limit
+        self.events = collections.deque()
+        self.overflowed = False
+        self.condition = threading.Condition()
+
+    def put(self, event, payload):
+        with self.condition:
+            if len(self.events) >= self.limit:
+                # A stalled client: drop the backlog and have the page reload
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append((event, payload))
+            self.condition.notify()
+
+    def get(self, timeout):
+        """Wait up to timeout for events; returns [(event, payload), ...], possibly empty"""
+        with self.condition:
+            if not self.events and not self.overflowed:
+                self.condition.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return [('reload', '{}')]
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+class EventHub:
+    """
+    Fans events (process changes, app start/stop, job progress) out to the
+    open /api/events streams. Publishing is a no-op while nobody listens.
+    """
+
+    def __init__(self, max_streams=SSE_MAX_STREAMS):
+        self.max_streams = max_streams
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        """Return a new EventSubscription, or None when all stream slots are taken"""
+        with self.lock:
+            if len(self.subscriptions) >= self.max_streams:
+                return None
+            subscription = EventSubscription()
+            self.subscriptions.append(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def active(self):
+        return bool(self.subscriptions)
+
+    def publish(self, event, data):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        if not subscriptions:
+            return
+        payload = json.dumps(data)
+        for subscription in subscriptions:
+            subscription.put(event, payload)
+
+event_hub = EventHub()
+
+def publish_job(job):
+    job.published = time.time()
+    event_hub.publish('job', job.to_dict())
+
+def current_job():
+    """Return the Job running on this thread, or None outside background jobs"""
+    return getattr(job_context, 'job', None)
+
+def report_progress(progress, message=None):
+    """Record progress (0.0-1.0) on the current job, if any"""
+    job = current_job()
+    if job:
+        changed = message and message != job.message
+        job.progress = progress
+        if message:
+            job.message = message
+        # Download chunks report often; pass on new steps, but throttle plain progress
+        if changed or time.time() - job.published >= JOB_EVENT_INTERVAL:
+            publish_job(job)
+
+def report_error(message):
+    """Log an error and mark the current job, if any, as failed"""
+    print(message)
+    job = current_job()
+    if job:
+        job.error = message
+
+def filter_process(pid, cmd):
+    """
+    Keep only processes that look like apps and clean up their command for
+    display. Returns (pid, cmd) or None.
+    """
+    # Look for various types of running apps:
+    # 1. Python processes (web apps, CLI tools)
+    # 2. Processes in /data/apps/ directory
+    # 3. Processes in /usr/local/bin/ directory
+    # 4. Any process that looks like an app
+    is_relevant = (
+        'python' in cmd.lower() or
+        '/data/apps/' in cmd or
+        '/usr/local/bin/' in cmd or
+        'app.py' in cmd or
+        (cmd.endswith('.py') and not 'taskapp.py' in cmd)  # Exclude taskapp itself
+    )
+    if not is_relevant:
+        return None
+
+    # Clean up command path for display
+    if '/data/' in cmd:
+        index = cmd.find('/data/') + len('/data/')
+        cmd = cmd[index:]
+    elif '/usr/local/bin/' in cmd:
+        index = cmd.find('/usr/local/bin/') + len('/usr/local/bin/')
+        cmd = cmd[index:]
+    return (pid, cmd)
+
+def app_name_from_command(cmd):
+    """
+    Extract a user-friendly app name from a command string.
+    Examples:
+    - 'python3 /data/apps/myapp/app.py' -> 'myapp'
+    - '/usr/local/bin/tool' -> 'tool'
+    - 'python3 /data/apps/webserver/app.py' -> 'webserver'
+    - 'myapp' -> 'myapp'
+    """
+    try:
+        # Remove common prefixes and extract the app name
+        if '/data/apps/' in cmd:
+            # Web app pattern: /data/apps/appname/app.py
+            parts = cmd.split('/data/apps/')
+            if len(parts) > 1:
+                app_part = parts[1].split('/')[0]
+                return app_part
+        elif '/usr/local/bin/' in cmd:
+            # CLI app pattern: /usr/local/bin/toolname
+            parts = cmd.split('/usr/local/bin/')
+            if len(parts) > 1:
+                app_part = parts[1].split()[0]  # Take first part before any args
+                return app_part
+        elif 'app.py' in cmd:
+            # Generic app.py pattern
+            if '/apps/' in cmd:
+                parts = cmd.split('/apps/')
+                if len(parts) > 1:
+                    app_part = parts[1].split('/')[0]
+                    return app_part
+            elif '/data/' in cmd:
+                parts = cmd.split('/data/')
+                if len(parts) > 1:
+                    app_part = parts[1].split('/')[0]
+                    return app_part
+
+        # Handle direct executable names (CLI apps)
+        if not '/' in cmd and not 'python' in cmd.lower():
+            # This might be a direct executable name
+            app_name = cmd.split()[0]  # Take first part before any args
+            return app_name
+
+        # Fallback: try to extract from the end of the path
+        if cmd.endswith('app.py'):
+            # Remove 'app.py' and get the directory name
+            clean_cmd = cmd.replace('app.py', '').rstrip('/')
+            app_name = os.path.basename(clean_cmd)
+            if app_name:
+                return app_name
+
+        # Last resort: return a cleaned version of the command
+        return os.path.basename(cmd.split()[0]) if cmd.split() else 'Unknown App'
+
+    except Exception as e:
+        print(f"Error extracting app name from command '{cmd}': {e}")
+        return 'Unknown App'
+
+class PidinBackend:
+    """Process list from QNX pidin (BB10)"""
+    name = 'pidin'
+
+    def sample(self):
+        """Return [(pid, full command), ...] for every process"""
+        try:
+            # Use pidin ar to get all processes
+            output = subprocess.check_output(['pidin', 'ar'], timeout=5, stderr=subprocess.DEVNULL).decode()
+        except subprocess.CalledProcessError:
+            # Fallback: try with different pidin options
+            output = subprocess.check_output(['pidin', '-f', '%a %A %n %p'], timeout=5, stderr=subprocess.DEVNULL).decode()
+        return self.parse(output)
+
+    def parse(self, output):
+        processes = []
+        for line in output.strip().split('\n'):
+            parts = line.split()
+            if len(parts) >= 2:
+                processes.append((parts[0], ' '.join(parts[1:])))
+        return processes
+
+    def usage(self, pids):
+        """
+        {pid: (cpu_seconds, memory_bytes)} from one pidin times and one
+        pidin mem call. Memory is the process's code plus data size, which
+        is what is resident on QNX (nothing is paged out); None if pidin mem
+        did not list the process.
+        """
+        wanted = set(pids)
+        output = subprocess.check_output(['pidin', 'times'], timeout=5, stderr=subprocess.DEVNULL).decode()
+        cpu = {}
+        for line in output.strip().split('\n'):
+            parts = line.split()
+            # pid name ... utime stime cutime cstime
+            if len(parts) >= 6 and parts[0] in wanted:
+                try:
+                    cpu[parts[0]] = parse_pidin_duration(parts[-4]) + parse_pidin_duration(parts[-3])
+                except ValueError:
+                    continue
+        try:
+            output = subprocess.check_output(['pidin', 'mem'], timeout=5, stderr=subprocess.DEVNULL).decode()
+            memory = self.parse_memory(output, wanted)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"pidin mem failed: {e}")
+            memory = {}
+        return {pid: (seconds, memory.get(pid)) for pid, seconds in cpu.items()}
+
+    def parse_memory(self, output, wanted):
+        """
+        {pid: code + data bytes} from pidin mem. Each thread line reads
+        "pid tid name prio STATE code data stack"; the indented lines under
+        it are the shared objects the process maps, counted by pidin
+        separately, so they are skipped.
+        """
+        memory = {}
+        for line in output.strip().split('\n'):
+            parts = line.split()
+            if len(parts) < 7 or parts[0] not in wanted or parts[0] in memory or not parts[1].isdigit():
+                continue
+            sizes = [part for part in parts[3:] if PIDIN_SIZE_PATTERN.fullmatch(part)]
+            if len(sizes) >= 2:
+                memory[parts[0]] = parse_pidin_size(sizes[0]) + parse_pidin_size(sizes[1])
+        return memory
+
+PIDIN_SIZE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)([KMG]?)')
+
+def parse_pidin_size(text):
+    """Bytes from a pidin size column such as 528K or 26M"""
+    value, unit = PIDIN_SIZE_PATTERN.fullmatch(text).groups()
+    return int(float(value) * {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[unit])
+
+def parse_pidin_duration(text):
+    """Seconds from a pidin time column such as 0.123s, 3m05s or 13h33m"""
+    units = {'d': 86400, 'h': 3600, 'm': 60, 's': 1, '': 1}
+    parts = re.findall(r'(\d+(?:\.\d+)?)([dhms]?)', text)
+    if not parts:
+        raise ValueError(f'Not a pidin duration: {text}')
+    return sum(float(value) * units[unit] for value, unit in parts)
+
+class ProcFsBackend:
+    """
+    Process list read straight from a /proc that has per-PID cmdline files,
+    without forking a helper. Each scan is diffed against the previous one
+    by PID, so only new PIDs have their command line read; a rescan mostly
+    costs one directory listing. The table is dropped when the last scan is
+    older than max_gap, so a PID reused in between is not mistaken for the
+    old process.
+    """
+    name = 'proc'
+
+    def __init__(self, proc_root='/proc', max_gap=PROCESS_SAMPLER_IDLE):
+        self.proc_root = proc_root
+        self.max_gap = max_gap
+        # pid -> (cmd, confirmed)
+        self.known = {}
+        self.scanned = 0
+        try:
+            self.clock_ticks = os.sysconf('SC_CLK_TCK')
+            self.page_size = os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            self.clock_ticks, self.page_size = 100, 4096
+
+    def read_cmd(self, pid):
+        with open(os.path.join(self.proc_root, pid, 'cmdline'), 'rb') as f:
+            cmdline = f.read()
+        return cmdline.replace(b'\0', b' ').decode(errors='replace').strip()
+
+    def sample(self):
+        now = time.time()
+        previous = self.known if now - self.scanned <= self.max_gap else {}
+        known = {}
+        processes = []
+        for pid in os.listdir(self.proc_root):
+            if not pid.isdigit():
+                continue
+            cached = previous.get(pid)
+            if cached and cached[1]:
+                cmd = cached[0]
+                confirmed = True
+            else:
+                try:
+                    cmd = self.read_cmd(pid)
+                except OSError:
+                    # Process exited while we were scanning
+                    continue
+                # A fresh PID may still be between fork and exec, so its
+                # command line is trusted once it reads the same twice
+                confirmed = cached is not None and cached[0] == cmd
+            known[pid] = (cmd, confirmed)
+            if cmd:  # Kernel threads have no command line
+                processes.append((pid, cmd))
+        # PIDs that disappeared are dropped by replacing the table
+        self.known = known
+        self.scanned = now
+        return processes
+
+    def usage(self, pids):
+        """{pid: (cpu_seconds, rss_bytes)} from each PID's stat and statm"""
+        usage = {}
+        for pid in pids:
+            try:
+                with open(os.path.join(self.proc_root, pid, 'stat'), 'rb') as f:
+                    stat_line = f.read()
+                with open(os.path.join(self.proc_root, pid, 'statm'), 'rb') as f:
+                    statm = f.read()
+                # Fields after the command name in parentheses start at state (3);
+                # utime and stime are fields 14 and 15
+                fields = stat_line[stat_line.rfind(b')') + 2:].split()
+                cpu = (int(fields[11]) + int(fields[12])) / self.clock_ticks
+                rss = int(statm.split()[1]) * self.page_size
+            except (OSError, IndexError, ValueError):
+                # Process exited, or not a Linux-style stat file
+                continue
+            usage[pid] = (cpu, rss)
+        return usage
+
+def choose_process_backend(name=PROCESS_BACKEND):
+    # QNX's /proc has no cmdline files, so BB10 keeps using pidin
+    if name == 'proc' or (name is None and os.path.exists('/proc/self/cmdline')):
+        return ProcFsBackend()
+    return PidinBackend()
+
+ProcessSnapshot = collections.namedtuple('ProcessSnapshot', ['taken', 'processes'])
+
+class RingBuffer:
+    """Fixed-size history of floats in an array('d'); new values overwrite the oldest"""
+
+    def __init__(self, size):
+        self.data = array.array('d', bytes(8 * size))
+        self.size = size
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        self.data[(self.start + self.count) % self.size] = value
+        if self.count < self.size:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.size
+
+    def values(self):
+        """Oldest to newest"""
+        end = self.start + self.count
+        if end <= self.size:
+            return self.data[self.start:end].tolist()
+        return self.data[self.start:].tolist() + self.data[:end - self.size].tolist()
+
+class ProcessSeries:
+    """CPU % and RSS history of one process; RSS is NaN where the backend has none"""
+
+    def __init__(self, history):
+        self.times = RingBuffer(history)
+        self.cpu = RingBuffer(history)
+        self.rss = RingBuffer(history)
+        self.last = None  # (taken, cpu_seconds) of the previous sample
+
+    def record(self, taken, cpu_seconds, rss):
+        last, self.last = self.last, (taken, cpu_seconds)
+        if last is None or taken <= last[0] or cpu_seconds < last[1]:
+            # First sample (or the PID was reused): only a baseline
+            return
+        self.times.append(taken)
+        self.cpu.append(max(0.0, (cpu_seconds - last[1]) / (taken - last[0]) * 100))
+        self.rss.append(float('nan') if rss is None else rss)
+
+class ProcessMetrics:
+    """
+    Per-PID ProcessSeries for the processes in the latest snapshot. History
+    is fixed-size per process and exited processes are dropped, so memory
+    stays bounded however long the server runs.
+    """
+
+    def __init__(self, history=METRICS_HISTORY):
+        self.history = history
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def record(self, snapshot, backend):
+        pids = [pid for pid, _ in snapshot.processes]
+        usage = backend.usage(pids) if pids else {}
+        with self.lock:
+            series = {}
+            for pid in pids:
+                series[pid] = self.series.get(pid) or ProcessSeries(self.history)
+                if pid in usage:
+                    series[pid].record(snapshot.taken, *usage[pid])
+            self.series = series
+
+    def get(self, pid):
+        with self.lock:
+            return self.series.get(str(pid))
+
+def downsample(values, points):
+    """Average values into at most `points` buckets, skipping NaN"""
+    if len(values) <= points:
+        return values
+    step = len(values) / points
+    result = []
+    for i in range(points):
+        bucket = [v for v in values[int(i * step):int((i + 1) * step)] if v == v]
+        result.append(sum(bucket) / len(bucket) if bucket else float('nan'))
+    return result
+
+def json_series(values, digits=2):
+    """Floats for JSON, NaN (no data) as null"""
+    return [None if v != v else (round(v, digits) if digits else int(v)) for v in values]
+
+def sparkline_svg(values, width=60, height=16):
+    """Inline SVG polyline for a short series, scaled to its own maximum"""
+    values = [v for v in values if v == v]
+    if len(values) < 2:
+        return ''
+    top = max(max(values), 1.0)
+    step = width / (len(values) - 1)
+    points = ' '.join(f'{i * step:.1f},{height - v / top * (height - 1):.1f}' for i, v in enumerate(values))
+    return (f'<svg class="sparkline" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+            f'<polyline fill="none" stroke="#00769e" stroke-width="1" points="{points}"/></svg>')
+
+def process_metrics_html(pid):
+    """Sparkline of recent CPU plus current CPU/RSS for a process card, or ''"""
+    series = process_metrics.get(pid)
+    if series is None or not len(series.cpu):
+        return ''
+    cpu = series.cpu.values()[-SPARKLINE_POINTS:]
+    rss = series.rss.values()[-1]
+    memory = f' &middot; {rss / (1024 * 1024):.1f} MB' if rss == rss else ''
+    return f'<div class="app-metrics">{sparkline_svg(cpu)} {cpu[-1]:.0f}% CPU{memory}</div>'
+
+class ProcessSampler:
+    """
+    Shares one immutable ProcessSnapshot between all renderers. A snapshot
+    is taken at most once per interval; while pages keep asking, a
+    background thread keeps it fresh so requests rarely wait on the backend.
+    """
+
+    def __init__(self, backend, interval=PROCESS_SAMPLE_INTERVAL, idle=PROCESS_SAMPLER_IDLE, metrics=None, on_change=None):
+        self.backend = backend
+        self.metrics = metrics
+        self.on_change = on_change  # Called with (previous, new) snapshot after each refresh
+        self.interval = interval
+        self.idle = idle
+        self.latest = None
+        self.last_read = 0
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.thread = None
+
+    def snapshot(self):
+        """Return the current snapshot, sampling first if it is stale"""
+        self.last_read = time.time()
+        self.ensure_running()
+        latest = self.latest
+        if latest is None or time.time() - latest.taken >= self.interval:
+            latest = self.refresh(latest)
+        return latest
+
+    def refresh(self, seen=None):
+        """Take a new snapshot unless another thread replaced `seen` meanwhile"""
+        with self.refresh_lock:
+            if self.latest is not seen:
+                return self.latest
+            try:
+                raw = self.backend.sample()
+            except Exception as e:
+                print(f'Error getting processes ({self.backend.name}): {e}')
+                raw = None
+            if raw is None:
+                processes = self.latest.processes if self.latest else ()
+            else:
+                processes = tuple(p for p in (filter_process(pid, cmd) for pid, cmd in raw) if p)
+            previous = self.latest
+            snapshot = ProcessSnapshot(time.time(), processes)
+            self.latest = snapshot
+            if self.on_change is not None and previous is not None and raw is not None:
+                try:
+                    self.on_change(previous, snapshot)
+                except Exception as e:
+                    print(f'Error publishing process changes: {e}')
+            return snapshot
+
+    def ensure_running(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='berrypy-processes', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            if time.time() - self.last_read > self.idle:
+                # Nobody is looking; stop until the next snapshot() call
+                with self.lock:
+                    self.thread = None
+                return
+            snapshot = self.refresh(self.latest)
+            if self.metrics is not None:
+                # Usage is another backend call (pidin forks on BB10), so it is
+                # only made here, never by a request refreshing a stale snapshot
+                try:
+                    self.metrics.record(snapshot, self.backend)
+                except Exception as e:
+                    print(f'Error reading process usage ({self.backend.name}): {e}')
+
+def publish_process_changes(previous, snapshot):
+    """Send process-set deltas and app start/stop transitions to live pages"""
+    if not event_hub.active() or previous.processes == snapshot.processes:
+        return
+    old = dict(previous.processes)
+    new = dict(snapshot.processes)
+    added = [pid for pid in new if pid not in old]
+    removed = [pid for pid in old if pid not in new]
+    if not added and not removed:
+        return
+    event_hub.publish('processes', {
+        'added': [{'pid': pid, 'app': app_name_from_command(new[pid]), 'cmd': new[pid]} for pid in added],
+        'removed': removed,
+    })
+
+    old_apps = {app_name_from_command(cmd): pid for pid, cmd in old.items()}
+    new_apps = {app_name_from_command(cmd): pid for pid, cmd in new.items()}
+    started = [app for app in new_apps if app not in old_apps]
+    ports = port_registry.ports_for([
+        (int(new_apps[app]), app) for app in started
+        if 'app.py' in new[new_apps[app]] or '/data/apps/' in new[new_apps[app]]
+    ])
+    for app in started:
+        pid = new_apps[app]
+        event_hub.publish('app', {'app': app, 'state': 'running', 'pid': pid, 'port': ports.get(int(pid))})
+    for app, pid in old_apps.items():
+        if app not in new_apps:
+            event_hub.publish('app', {'app': app, 'state': 'stopped', 'pid': pid, 'port': None})
+
+process_metrics = ProcessMetrics()
+process_sampler = ProcessSampler(choose_process_backend(), metrics=process_metrics, on_change=publish_process_changes)
+
+def probe_ports(ports, timeout=PORT_PROBE_TIMEOUT):
+    """
+    Try to connect to all of the given localhost ports at once with
+    non-blocking sockets. Returns the set of ports that accepted.
+    """
+    open_ports = set()
+    pending = {}
+    try:
+        for port in set(ports):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            result = sock.connect_ex(('127.0.0.1', port))
+            if result in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                pending[sock] = port
+                continue
+            if result == 0:
+                open_ports.add(port)
+            sock.close()
+
+        deadline = time.time() + timeout
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            _, writable, _ = select.select([], list(pending), [], remaining)
+            if not writable:
+                break
+            for sock in writable:
+                port = pending.pop(sock)
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    open_ports.add(port)
+                sock.close()
+    finally:
+        for sock in pending:
+            sock.close()
+    return open_ports
+
+def listening_ports(lines, pid=None):
+    """Ports in the user range on LISTEN lines of netstat output, optionally only lines mentioning pid"""
+    ports = []
+    for line in lines:
+        if 'LISTEN' not in line or (pid is not None and str(pid) not in line):
+            continue
+        for part in line.split():
+            if ':' in part:
+                try:
+                    port = int(part.split(':')[-1])
+                except ValueError:
+                    continue
+                if 1024 <= port <= 65535:
+                    ports.append(port)
+    return ports
+
+class PortRegistry:
+    """
+    Finds the ports of running web apps for the page renderers. Port
+    declarations parsed from each app.py are cached by mtime, one netstat
+    snapshot is shared by every lookup in a refresh cycle, and connect
+    probes for all apps run together in a single round.
+    """
+
+    def __init__(self, netstat_ttl=PORT_NETSTAT_TTL):
+        self.netstat_ttl = netstat_ttl
+        self.declarations = {}  # app.py path -> (mtime, [(port, description), ...])
+        self.netstat = (0, [])
+        self.lock = threading.Lock()
+        self.netstat_lock = threading.Lock()
+
+    def declared_ports(self, app_name):
+        """Candidate ports from the app's app.py, in pattern order"""
+        app_path = os.path.join(WEB_APPS_DIR, app_name, 'app.py')
+        try:
+            mtime = os.stat(app_path).st_mtime
+        except OSError:
+            return []
+        with self.lock:
+            cached = self.declarations.get(app_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        ports = []
+        try:
+            with open(app_path, 'r') as f:
+                content = f.read()
+            for pattern, desc in PORT_PATTERNS:
+                port_match = pattern.search(content)
+                if port_match:
+                    port = int(port_match.group(1))
+                    if 1024 <= port <= 65535:  # Valid user port range
+                        ports.append((port, desc))
+        except Exception as e:
+            print(f"Error parsing app.py for port: {e}")
+        with self.lock:
+            self.declarations[app_path] = (mtime, ports)
+        return ports
+
+    def netstat_lines(self):
+        """netstat -an output lines, taken at most once per refresh cycle"""
+        with self.netstat_lock:
+            taken, lines = self.netstat
+            if time.time() - taken < self.netstat_ttl:
+                return lines
+            try:
+                output = subprocess.check_output(['netstat', '-an'], timeout=5, stderr=subprocess.DEVNULL).decode()
+                lines = output.strip().split('\n')
+            except Exception as e:
+                print(f"DEBUG: netstat check failed: {e}")
+                lines = []
+            self.netstat = (time.time(), lines)
+            return lines
+
+    def detect(self, wanted, confirmed=None):
+        """
+        Detect ports for [(pid, app_name), ...] together. Returns {pid: port}
+        for the apps that were found; pids whose port netstat tied to the
+        process itself are added to `confirmed` when given.
+        """
+        found = {}
+        if not wanted:
+            return found
+        declared = {pid: self.declared_ports(app_name) for pid, app_name in wanted}
+
+        # Method 1: a port declared in app.py that is actually accepting connections
+        active = probe_ports(port for ports in declared.values() for port, _ in ports)
+        for pid, app_name in wanted:
+            for port, desc in declared[pid]:
+                if port in active:
+                    print(f"DEBUG: Found port {port} for {app_name} in app.py ({desc}), verified active")
+                    found[pid] = port
+                    break
+        remaining = [(pid, app_name) for pid, app_name in wanted if pid not in found]
+        if not remaining:
+            return found
+
+        # Method 2: the shared netstat snapshot, by PID first, then the common web range
+        lines = self.netstat_lines()
+        web_ports = [port for port in listening_ports(lines) if 8000 <= port <= 9000]
+        common = None
+        for pid, app_name in remaining:
+            pid_ports = listening_ports(lines, pid)
+            if pid_ports:
+                print(f"DEBUG: Found port {pid_ports[0]} via netstat (PID match)")
+                found[pid] = pid_ports[0]
+                if confirmed is not None:
+                    confirmed.add(pid)
+                continue
+            candidates = web_ports
+            if not candidates:
+                # Method 3: direct socket check of common ports, probed once for everyone
+                if common is None:
+                    common = sorted(probe_ports(COMMON_WEB_PORTS))
+                candidates = common
+            if candidates:
+                # Prefer port 8000 if available, as it's a common default
+                found[pid] = 8000 if 8000 in candidates else min(candidates)
+            else:
+                print(f"DEBUG: No port found for PID {pid}")
+        return found
+
+    def ports_for(self, wanted):
+        """
+        Ports for [(pid, app_name), ...], from app_ports where known and
+        detected together otherwise. Detected ports are remembered in app_ports;
+        only those netstat confirmed for the pid take a lease.
+        """
+        ports = {}
+        missing = []
+        with app_ports_lock:
+            for pid, app_name in wanted:
+                if pid in app_ports:
+                    ports[pid] = app_ports[pid]
+                else:
+                    missing.append((pid, app_name))
+        confirmed = set()
+        detected = self.detect(missing, confirmed)
+        names = dict(wanted)
+        for pid, port in detected.items():
+            if pid not in confirmed or not port_allocator.bind(port, names[pid], pid):
+                with app_ports_lock:
+                    app_ports[pid] = port
+        ports.update(detected)
+        return ports
+
+port_registry = PortRegistry()
+
+class PortAllocator:
+    """
+    Lease table of the ports web apps listen on: port -> (app_name, pid).
+    A launch reserves its port first, so a port leased to another app or
+    already accepting connections is a conflict found before the app
+    starts. Apps that read PORT/BERRYPY_PORT can be given a free port
+    instead. app_ports is the pid -> port side of the same table.
+    """
+
+    def __init__(self, assign_range=PORT_ASSIGN_RANGE):
+        self.assign_range = assign_range
+        self.leases = {}  # pid is None while the app is being launched
+        self.lock = threading.Lock()
+
+    def expire(self):
+        # Caller holds self.lock; drops leases of processes that are gone
+        for port, (app_name, pid) in list(self.leases.items()):
+            if pid is not None and not pid_alive(pid):
+                del self.leases[port]
+                with app_ports_lock:
+                    app_ports.pop(pid, None)
+
+    def holder(self, port):
+        """Who has port: a description of the lease holder or listener, or None"""
+        lease = self.leases.get(port)
+        if lease:
+            app_name, pid = lease
+            return f"{app_name} (PID {pid})" if pid else f"{app_name} (starting)"
+        if probe_ports([port]):
+            return "another process"
+        return None
+
+    def acquire(self, app_name, declared, assign=False):
+        """
+        Reserve a port for app_name before launching it. Returns declared
+        if it is free. If it is taken (or there is none) and assign is set,
+        returns a free port from assign_range; otherwise raises LaunchError
+        naming the holder.
+        """
+        with self.lock:
+            self.expire()
+            holder = self.holder(declared) if declared else None
+            if declared and holder is None:
+                self.leases[declared] = (app_name, None)
+                return declared
+            if not assign:
+                if declared is None:
+                    raise LaunchError(f"Could not find PORT in {app_name}/app.py")
+                raise LaunchError(f"Port {declared} for {app_name} is already in use by {holder}")
+            low, high = self.assign_range
+            candidates = [port for port in range(low, high + 1) if port not in self.leases]
+            active = probe_ports(candidates)
+            for port in candidates:
+                if port not in active:
+                    self.leases[port] = (app_name, None)
+                    return port
+            raise LaunchError(f"No free port for {app_name} in {low}-{high}")
+
+    def bind(self, port, app_name, pid):
+        """
+        Attach a running process to its port's lease. Returns False, leaving
+        the lease alone, when the port belongs to another live process or to
+        another app's pending launch.
+        """
+        with self.lock:
+            lease = self.leases.get(port)
+            if lease and lease[1] != pid:
+                held_by, holder_pid = lease
+                if holder_pid is None and held_by != app_name:
+                    return False
+                if holder_pid is not None and pid_alive(holder_pid):
+                    return False
+            self.leases[port] = (app_name, pid)
+            with app_ports_lock:
+                app_ports[pid] = port
+            return True
+
+    def release(self, pid):
+        """Drop the lease held by a process that exited or was stopped"""
+        with self.lock:
+            for port, (app_name, lease_pid) in list(self.leases.items()):
+                if lease_pid == pid:
+                    del self.leases[port]
+            with app_ports_lock:
+                app_ports.pop(pid, None)
+
+    def cancel(self, port, app_name):
+        """Drop a reservation whose launch failed"""
+        with self.lock:
+            if self.leases.get(port) == (app_name, None):
+                del self.leases[port]
+
+    def table(self):
+        with self.lock:
+            self.expire()
+            return [{'port': port, 'app': app_name, 'pid': pid}
+                    for port, (app_name, pid) in sorted(self.leases.items())]
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but belongs to someone else
+    return True
+
+port_allocator = PortAllocator()
+
+class RotatingLog:
+    """
+    Append-only log of one app's output, rotated to <app>.log.1 ... once
+    it reaches max_bytes. Readers can wait for new output on `changed`.
+    """
+
+    def __init__(self, app_name, directory=None, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = os.path.join(directory or LOG_DIR, f'{app_name}.log')
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+        self.pipes = 0  # Open pipes writing here (changed by LogCapture under its lock)
+        self.changed = threading.Condition()
+        self.rotations = 0  # Lets followers notice their offset now points into an older file
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def write(self, data):
+        with self.changed:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'ab')
+            if self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+                self.rotate()
+            self.file.write(data)
+            self.file.flush()
+            self.changed.notify_all()
+
+    def rotate(self):
+        # Caller holds self.changed
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'ab')
+        self.rotations += 1
+
+    def close(self):
+        """Release the file once nothing writes here; write() reopens it"""
+        with self.changed:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def read(self, offset, length):
+        """Up to length bytes of the current file from offset, without reading the rest"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+        except OSError:
+            return b''
+
+    def wait(self, offset, timeout):
+        """Block until the current file grows past offset (or rotates), or timeout"""
+        rotations = self.rotations
+        with self.changed:
+            self.changed.wait_for(lambda: self.size() > offset or self.rotations != rotations, timeout)
+
+class LogCapture:
+    """
+    Drains the stdout/stderr pipes of every launched app on one selector
+    thread, so a chatty app never blocks on a full pipe and its output ends
+    up in a RotatingLog per app instead of being lost.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.logs = {}
+        self.lock = threading.Lock()
+        self.pending = collections.deque()  # (pipe, log) waiting to be registered
+        self.selector = None
+        self.wakeup = None
+        self.thread = None
+
+    def log_for(self, app_name, create=True):
+        """
+        The app's RotatingLog. With create=False (readers asking by name)
+        None unless the app was launched or has a log on disk, so
+        arbitrary names do not pile up in self.logs.
+        """
+        with self.lock:
+            log = self.logs.get(app_name)
+            if log is None:
+                log = RotatingLog(app_name, self.directory)
+                if not create and not os.path.exists(log.path):
+                    return None
+                self.logs[app_name] = log
+            return log
+
+    def attach(self, app_name, process):
+        """Start capturing a Popen's stdout and stderr (both must be PIPE)"""
+        log = self.log_for(app_name)
+        log.write(f'--- {time.strftime("%Y-%m-%d %H:%M:%S")} started {app_name} (PID {process.pid}) ---\n'.encode())
+        with self.lock:
+            for pipe in (process.stdout, process.stderr):
+                if pipe is not None:
+                    self.pending.append((pipe, log))
+                    log.pipes += 1
+            self.ensure_running()
+        os.write(self.wakeup[1], b'x')
+
+    def ensure_running(self):
+        # Caller holds self.lock
+        if self.thread is None:
+            self.selector = selectors.DefaultSelector()
+            self.wakeup = os.pipe()
+            self.selector.register(self.wakeup[0], selectors.EVENT_READ, None)
+            self.thread = threading.Thread(target=self.run, name='berrypy-logs', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    # Woken up by attach(): register the new pipes
+                    os.read(self.wakeup[0], 512)
+                    with self.lock:
+                        while self.pending:
+                            pipe, log = self.pending.popleft()
+                            self.selector.register(pipe, selectors.EVENT_READ, log)
+                    continue
+                log = key.data
+                try:
+                    data = os.read(key.fd, LOG_READ_SIZE)
+                except OSError:
+                    data = b''
+                if data:
+                    try:
+                        log.write(data)
+                    except OSError as e:
+                        print(f"Error writing log {log.path}: {e}")
+                    continue
+                # End of stream: the app closed it or exited
+                self.selector.unregister(key.fileobj)
+                key.fileobj.close()
+                with self.lock:
+                    log.pipes -= 1
+                    idle = log.pipes == 0
+                if idle:
+                    log.close()
+
+    def tail(self, app_name, length=LOG_TAIL_BYTES):
+        """The last length bytes of an app's current log, decoded"""
+        log = self.log_for(app_name, create=False)
+        if log is None:
+            return ''
+        size = log.size()
+        return log.read(max(0, size - length), length).decode(errors='replace')
+
+log_capture = LogCapture()
+log_followers = threading.BoundedSemaphore(LOG_MAX_FOLLOWERS)
+
+app_settings_lock = threading.RLock()  # save_app_setting reloads while holding it
+app_settings_cache = [None, None]  # [mtime, settings] of APP_SETTINGS_FILE
+
+def load_app_settings():
+    """{app_name: {option: value}} from APP_SETTINGS_FILE, re-read only when it changes"""
+    with app_settings_lock:
+        try:
+            mtime = os.path.getmtime(APP_SETTINGS_FILE)
+        except OSError:
+            return {}
+        if app_settings_cache[0] != mtime:
+            try:
+                with open(APP_SETTINGS_FILE, 'r') as f:
+                    settings = json.load(f).get('apps', {})
+            except (OSError, ValueError) as e:
+                print(f"Error reading {APP_SETTINGS_FILE}: {e}")
+                settings = {}
+            app_settings_cache[:] = [mtime, settings]
+        return app_settings_cache[1]
+
+def save_app_setting(app_name, option, value):
+    """Set one option for an app (None removes it), writing the file atomically"""
+    with app_settings_lock:
+        settings = {name: dict(options) for name, options in load_app_settings().items()}
+        options = settings.setdefault(app_name, {})
+        if value is None:
+            options.pop(option, None)
+        else:
+            options[option] = value
+        if not options:
+            del settings[app_name]
+        os.makedirs(os.path.dirname(APP_SETTINGS_FILE), exist_ok=True)
+        temp_path = APP_SETTINGS_FILE + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'apps': settings}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, APP_SETTINGS_FILE)
+        app_settings_cache[:] = [None, None]
+
+def app_setting(app_name, option, default=None):
+    return load_app_settings().get(app_name, {}).get(option, default)
+
+def catalog_version(app_name, app_type):
+    """The version the store's catalog lists for an app, or None"""
+    index = get_catalog_index(app_type)
+    info = index.apps.get(app_name) if index else None
+    return str(info['version']) if isinstance(info, dict) and info.get('version') is not None else None
+
+class PackageDatabase:
+    """
+    Installed packages, stored in PACKAGE_DB_FILE as {"packages": {"<type>/<name>":
+    record}} where a record has the files the install wrote, version, size
+    and install time. It is held in memory with a file -> packages index,
+    so uninstalls, ownership and version queries are lookups rather than
+    filesystem walks.
+    """
+
+    def __init__(self, path=PACKAGE_DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.packages = {}
+        self.owners = {}  # file path -> set of package keys that installed it
+
+    def load(self):
+        # Caller holds self.lock; the file is re-read only when it changes
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return
+        packages = {}
+        if mtime is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    packages = json.load(f).get('packages', {})
+            except (OSError, ValueError) as e:
+                print(f"Error reading {self.path}: {e}")
+        self.mtime = mtime
+        self.packages = packages
+        self.owners = {}
+        for key, record in packages.items():
+            for path in record.get('files', []):
+                self.owners.setdefault(path, set()).add(key)
+
+    def save(self):
+        # Caller holds self.lock
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'packages': self.packages}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def record(self, app_name, app_type, files, version=None, size=None, sha256=None):
+        """
+        Store (or replace) the manifest of an install. Returns the files
+        an earlier install of the package wrote that this one did not and
+        no other package owns, for the caller to remove.
+        """
+        key = f'{app_type}/{app_name}'
+        files = sorted(set(files))
+        if size is None:
+            size = sum(os.path.getsize(path) for path in files if os.path.isfile(path))
+        record = {
+            'name': app_name,
+            'type': app_type,
+            'version': version,
+            'size': size,
+            'installed': time.time(),
+            'sha256': sha256,
+            'files': files,
+        }
+        with self.lock:
+            self.load()
+            stale = [path for path in self.forget(key) if path not in files]
+            self.packages[key] = record
+            for path in files:
+                self.owners.setdefault(path, set()).add(key)
+            self.save()
+        return stale
+
+    def forget(self, key):
+        # Caller holds self.lock; drops a package from the owners index
+        record = self.packages.pop(key, None)
+        if record is None:
+            return []
+        orphans = []
+        for path in record.get('files', []):
+            owners = self.owners.get(path, set())
+            owners.discard(key)
+            if not owners:
+                self.owners.pop(path, None)
+                orphans.append(path)
+        return orphans
+
+    def remove(self, app_name, app_type):
+        """
+        Drop a package and return the files no other package installed
+        too, or None if the package is not in the database.
+        """
+        key = f'{app_type}/{app_name}'
+        with self.lock:
+            self.load()
+            if key not in self.packages:
+                return None
+            orphans = self.forget(key)
+            self.save()
+        return orphans
+
+    def get(self, app_name, app_type):
+        with self.lock:
+            self.load()
+            return self.packages.get(f'{app_type}/{app_name}')
+
+    def owner(self, path, app_type):
+        """Name of a package of app_type that installed path, or None"""
+        with self.lock:
+            self.load()
+            for key in sorted(self.owners.get(path, ())):
+                record = self.packages[key]
+                if record['type'] == app_type:
+                    return record['name']
+        return None
+
+    def summary(self, app_type=None):
+        """Name, type, version, size, install time and file count of each package"""
+        with self.lock:
+            self.load()
+            return [
+                {**{k: v for k, v in record.items() if k != 'files'}, 'file_count': len(record.get('files', []))}
+                for key, record in sorted(self.packages.items())
+                if app_type is None or record['type'] == app_type
+            ]
+
+package_db = PackageDatabase()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class PackageCache:
+    """
+    Content-addressed store of downloaded package zips: <sha256>.zip in
+    PACKAGE_CACHE_DIR, with index.json mapping each package version to its
+    hash. Zips are hashed when stored and again before use, so a corrupt
+    file is dropped and downloaded again rather than installed. Once the
+    cache is over max_bytes the least recently used zips are evicted; use
+    times reach index.json with the next store.
+    """
+
+    def __init__(self, directory=PACKAGE_CACHE_DIR, max_bytes=PACKAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
+        self.index = None
+        self.counters = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'corrupt': 0}
+
+    def load(self):
+        # Caller holds self.lock
+        if self.index is None:
+            self.index = {'objects': {}, 'versions': {}}
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.index.update(json.load(f))
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"Error reading {self.index_path}: {e}")
+        return self.index
+
+    def save(self):
+        # Caller holds self.lock
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.index_path)
+
+    def object_path(self, sha256):
+        return os.path.join(self.directory, sha256 + '.zip')
+
+    def drop(self, sha256):
+        # Caller holds self.lock; removes an object and every version pointing at it
+        self.index['objects'].pop(sha256, None)
+        for key in [key for key, value in self.index['versions'].items() if value == sha256]:
+            del self.index['versions'][key]
+        try:
+            os.remove(self.object_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def lookup(self, app_name, app_type, version=None):
+        """
+        (path, index entry) of the cached zip for a package version (the
+        most recently stored one when version is None), or None. The zip is
+        verified against its hash first, outside the lock.
+        """
+        key = f'{app_type}/{app_name}@{version}' if version is not None else f'{app_type}/{app_name}'
+        with self.lock:
+            index = self.load()
+            sha256 = index['versions'].get(key)
+            if sha256 is None or sha256 not in index['objects']:
+                self.counters['misses'] += 1
+                return None
+        path = self.object_path(sha256)
+        try:
+            intact = file_sha256(path) == sha256
+        except OSError:
+            intact = False
+        with self.lock:
+            entry = index['objects'].get(sha256)
+            if entry is None:
+                # Evicted while we were hashing it
+                self.counters['misses'] += 1
+                return None
+            if not intact:
+                print(f"Cached package {key} failed verification, dropping it")
+                self.drop(sha256)
+                self.save()
+                self.counters['corrupt'] += 1
+                self.counters['misses'] += 1
+                return None
+            entry['used'] = time.time()
+            self.counters['hits'] += 1
+            return path, dict(entry)
+
+    def store(self, path, app_name, app_type, version=None):
+        """
+        Move a downloaded zip into the cache under its hash and return
+        (cached path, sha256). The stored copy is hashed again before the
+        download is trusted.
+        """
+        sha256 = file_sha256(path)
+        target = self.object_path(sha256)
+        with self.lock:
+            index = self.load()
+            os.makedirs(self.directory, exist_ok=True)
+            os.replace(path, target)
+            if file_sha256(target) != sha256:
+                os.remove(target)
+                raise OSError(f"Cached copy of {app_name} does not match its download")
+            index['objects'][sha256] = {'size': os.path.getsize(target), 'used': time.time(),
+                                        'name': app_name, 'type': app_type, 'version': version}
+            index['versions'][f'{app_type}/{app_name}'] = sha256
+            if version is not None:
+                index['versions'][f'{app_type}/{app_name}@{version}'] = sha256
+            self.counters['stored'] += 1
+            self.evict(keep=sha256)
+            self.save()
+        return target, sha256
+
+    def evict(self, keep=None):
+        # Caller holds self.lock; least recently used first, never the zip being installed
+        objects = self.index['objects']
+        total = sum(entry['size'] for entry in objects.values())
+        for sha256, entry in sorted(objects.items(), key=lambda item: item[1]['used']):
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            total -= entry['size']
+            self.drop(sha256)
+            self.counters['evicted'] += 1
+            print(f"Evicted cached package {entry['type']}/{entry['name']} {entry['version'] or ''}")
+
+    def stats(self):
+        with self.lock:
+            objects = self.load()['objects']
+            return dict(self.counters, entries=len(objects), bytes=sum(entry['size'] for entry in objects.values()),
+                        max_bytes=self.max_bytes)
+
+package_cache = PackageCache()
+
+class UnsafePackageError(Exception):
+    """A package member would be written outside its install directory"""
+
+def member_target(root, name):
+    """root/name for a zip member, refusing names that escape root (zip slip)"""
+    target = os.path.normpath(os.path.join(root, name))
+    if os.path.isabs(name) or not target.startswith(os.path.normpath(root) + os.sep):
+        raise UnsafePackageError(f"Refusing to extract {name!r} outside {root}")
+    return target
+
+def extract_members(zip_path, members, workers=EXTRACT_WORKERS):
+    """
+    Stream [(member name, target path)] out of a zip in EXTRACT_CHUNK_SIZE
+    pieces, so memory use does not grow with the member size. With
+    workers > 1 the members are split between threads, each reading its
+    own ZipFile handle.
+    """
+    def extract(group):
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for name, target in group:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with zip_ref.open(name) as source, open(target, 'wb') as out:
+                    shutil.copyfileobj(source, out, EXTRACT_CHUNK_SIZE)
+
+    if workers > 1 and len(members) > workers:
+        groups = [members[i::workers] for i in range(workers)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='berrypy-extract') as executor:
+            for future in [executor.submit(extract, group) for group in groups]:
+                future.result()
+    else:
+        extract(members)
+
+def swap_files(moves):
+    """
+    Rename staged files into place: [(staged path, target path)]. Targets
+    that exist are moved aside first; if any rename fails, the ones done
+    so far are undone, leaving the old files as they were.
+    """
+    done = []  # (target, path the old file was moved to, or None)
+    try:
+        for staged, target in moves:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            previous = None
+            if os.path.lexists(target):
+                previous = staged + '.previous'
+                os.replace(target, previous)
+            try:
+                os.replace(staged, target)
+            except OSError:
+                if previous:
+                    os.replace(previous, target)
+                raise
+            done.append((target, previous))
+    except OSError:
+        for target, previous in reversed(done):
+            if previous:
+                os.replace(previous, target)
+            else:
+                os.remove(target)
+        raise
+
+def swap_directory(staged, target):
+    """Replace the target directory with the staged one: two renames, the old one removed after"""
+    previous = None
+    if os.path.exists(target):
+        previous = staged + '.previous'
+        os.rename(target, previous)
+    try:
+        os.rename(staged, target)
+    except OSError:
+        if previous:
+            os.rename(previous, target)
+        raise
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+
+def carry_over_files(old_dir, staging, previous_record):
+    """
+    Link files a web app created at runtime (data, settings) from its
+    current directory into the staged new version. Files the package
+    itself installed last time are left behind, and so is anything the
+    new version ships.
+    """
+    packaged = set(previous_record['files']) if previous_record else set()
+    for root, dirs, files in os.walk(old_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            staged = os.path.join(staging, os.path.relpath(path, old_dir))
+            if path in packaged or os.path.lexists(staged):
+                continue
+            os.makedirs(os.path.dirname(staged), exist_ok=True)
+            try:
+                os.link(path, staged)
+            except OSError:
+                shutil.copy2(path, staged)
+
+def version_key(version):
+    """Sort key for version strings: numeric parts compare as numbers (1.10 > 1.9)"""
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part)
+            for part in re.findall(r'\d+|[A-Za-z]+', str(version))]
+
+def find_updates():
+    """
+    Packages whose catalog version is newer than the installed one, from
+    the cached catalog indexes of both stores. Packages installed without
+    a known version are not reported.
+    """
+    updates = []
+    for package in package_db.summary():
+        if package['version'] is None:
+            continue
+        available = catalog_version(package['name'], package['type'])
+        if available is not None and version_key(available) > version_key(package['version']):
+            updates.append({'name': package['name'], 'type': package['type'],
+                            'installed': package['version'], 'available': available})
+    return updates
+
+def remove_package_files(paths, roots):
+    """Delete files, then any directories they leave empty up to (not including) roots"""
+    directories = set()
+    for path in paths:
+        try:
+            os.remove(path)
+            print(f"Removed {path}")
+        except FileNotFoundError:
+            pass
+        directories.add(os.path.dirname(path))
+    roots = set(os.path.abspath(root) for root in roots)
+    # Deepest first, so nested empty directories go before their parents
+    for directory in sorted(directories, key=len, reverse=True):
+        directory = os.path.abspath(directory)
+        while directory not in roots and any(directory.startswith(root + os.sep) for root in roots):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break  # Not empty
+            directory = os.path.dirname(directory)
+
+class LaunchError(Exception):
+    """Raised when an app cannot be launched (missing files, no port declared)"""
+
+def launch_app(app_name, app_type='cli', manual=True):
+    """
+    Start an installed app with its output captured and hand it to the
+    supervisor. Returns the Popen. manual=False marks a supervisor restart.
+    """
+    if app_type == 'web':
+        app_path = os.path.join(WEB_APPS_DIR, app_name, 'app.py')
+        if not os.path.exists(app_path):
+            raise LaunchError(f"Web app not found: {app_path}")
+        # First read the port from app.py - this is now our primary method
+        port = None
+        try:
+            with open(app_path, 'r') as f:
+                content = f.read()
+                # Look for PORT = XXXX pattern (most common in BB10 apps)
+                port_match = re.search(r'PORT\s*=\s*(\d+)', content)
+                if port_match:
+                    port = int(port_match.group(1))
+                    print(f"Found port {port} in {app_name}/app.py (PORT variable)")
+                else:
+                    # Look for port in app.run() call: app.run(port=XXXX)
+                    port_match = re.search(r'app\.run\([^)]*port\s*=\s*(\d+)', content)
+                    if port_match:
+                        port = int(port_match.group(1))
+                        print(f"Found port {port} in {app_name}/app.py (app.run)")
+        except Exception as e:
+            raise LaunchError(f"Error reading port from app.py: {e}")
+
+        # Apps that read BERRYPY_PORT (or have the assign_port setting) can
+        # be moved to a free port; the rest must get the port they declare
+        assign = app_setting(app_name, 'assign_port')
+        if assign is None:
+            assign = 'BERRYPY_PORT' in content
+        declared = port
+        port = port_allocator.acquire(app_name, declared, assign)
+        if port != declared:
+            print(f"Port {declared} is taken, assigning {port} to {app_name} through BERRYPY_PORT")
+
+        # Start the process
+        env = dict(os.environ, PORT=str(port), BERRYPY_PORT=str(port))
+        try:
+            process = subprocess.Popen(['python3', app_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        except Exception:
+            port_allocator.cancel(port, app_name)
+            raise
+        log_capture.attach(app_name, process)
+        print(f"Started web app: {app_name} with PID: {process.pid}")
+        port_allocator.bind(port, app_name, process.pid)
+        print(f"Using port {port} for {app_name}")
+    else:
+        # Handle CLI apps
+        app_path = os.path.join(CLI_APPS_DIR, app_name)
+        if not os.path.exists(app_path):
+            raise LaunchError(f"CLI app not found: {app_path}")
+        # Make sure the file is executable
+        os.chmod(app_path, os.stat(app_path).st_mode | stat.S_IXUSR)
+
+        # Start the CLI app in background
+        process = subprocess.Popen([app_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        log_capture.attach(app_name, process)
+        print(f"Started CLI app: {app_name} with PID: {process.pid}")
+
+    supervisor.track(app_name, app_type, process, manual)
+    return process
+
+class SupervisedApp:
+    """What the supervisor knows about one app it launched"""
+
+    def __init__(self, name, app_type):
+        self.name = name
+        self.app_type = app_type
+        self.process = None
+        self.state = 'running'  # running | backoff | crash-loop | exited | stopped
+        self.started = None
+        self.restarts = 0
+        self.recent_restarts = collections.deque()  # Times of restarts inside CRASH_LOOP_WINDOW
+        self.backoff = RESTART_BACKOFF_INITIAL
+        self.next_restart = None
+        self.last_exit = None
+        self.last_error = None
+        self.stopping = False  # Set when a user stops it, so the exit is not a crash
+
+    def to_dict(self):
+        return {
+            'app': self.name,
+            'type': self.app_type,
+            'state': self.state,
+            'pid': self.process.pid if self.process else None,
+            'policy': app_setting(self.name, 'restart', DEFAULT_RESTART_POLICY),
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+            'last_error': self.last_error,
+            'next_restart': self.next_restart,
+            'startup': startup_stats.summary(self.name),
+        }
+
+class Supervisor:
+    """
+    Watches the apps BerryPy launched and restarts them by their restart
+    policy (never, on-failure, always) without any page being loaded.
+    Restarts back off exponentially; too many in CRASH_LOOP_WINDOW is a
+    crash loop and the app is left down until started again.
+    """
+
+    def __init__(self, interval=SUPERVISOR_INTERVAL):
+        self.interval = interval
+        self.apps = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def track(self, app_name, app_type, process, manual=True):
+        with self.lock:
+            entry = self.apps.get(app_name)
+            if entry is None:
+                entry = self.apps[app_name] = SupervisedApp(app_name, app_type)
+            if manual:
+                # Started by hand: forget earlier crashes
+                entry.recent_restarts.clear()
+                entry.backoff = RESTART_BACKOFF_INITIAL
+            entry.app_type = app_type
+            entry.process = process
+            entry.state = 'running'
+            entry.started = time.time()
+            entry.next_restart = None
+            entry.stopping = False
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='berrypy-supervisor', daemon=True)
+                self.thread.start()
+        self.publish(entry)
+
+    def process_for(self, pid):
+        """The Popen of a running app we launched with this PID, or None"""
+        with self.lock:
+            for entry in self.apps.values():
+                if entry.process and entry.process.pid == int(pid):
+                    return entry.process
+        return None
+
+    def running(self):
+        """(pid, app_name) of every app we launched that is still running"""
+        with self.lock:
+            return [(str(entry.process.pid), entry.name) for entry in self.apps.values()
+                    if entry.state == 'running' and entry.process is not None]
+
+    def expect_exit(self, pid):
+        """Called before a user stops an app, so it is not restarted"""
+        with self.lock:
+            for entry in self.apps.values():
+                if entry.process and entry.process.pid == int(pid):
+                    entry.stopping = True
+
+    def status(self, app_name=None):
+        with self.lock:
+            if app_name is not None:
+                entry = self.apps.get(app_name)
+                return entry.to_dict() if entry else None
+            return [entry.to_dict() for entry in self.apps.values()]
+
+    def publish(self, entry):
+        event_hub.publish('supervisor', entry.to_dict())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            due = []
+            changed = []
+            with self.lock:
+                for entry in self.apps.values():
+                    if entry.state == 'running' and entry.process is not None:
+                        returncode = entry.process.poll()
+                        if returncode is not None:
+                            self.exited(entry, returncode, now)
+                            changed.append(entry)
+                    elif entry.state == 'backoff' and entry.next_restart <= now:
+                        due.append(entry)
+            for entry in changed:
+                self.publish(entry)
+            for entry in due:
+                self.restart(entry)
+
+    def exited(self, entry, returncode, now):
+        # Caller holds self.lock; returncode is None when a restart failed to launch
+        if returncode is not None:
+            entry.last_exit = returncode
+        if entry.process is not None:
+            port_allocator.release(entry.process.pid)
+        entry.process = None
+        policy = app_setting(entry.name, 'restart', DEFAULT_RESTART_POLICY)
+        if entry.stopping:
+            entry.state = 'stopped'
+            return
+        print(f"Supervisor: {entry.name} exited with code {returncode}")
+        if policy == 'never' or (policy == 'on-failure' and returncode == 0):
+            entry.state = 'exited'
+            return
+        if entry.started and now - entry.started >= RESTART_STABLE_AFTER:
+            entry.backoff = RESTART_BACKOFF_INITIAL
+        while entry.recent_restarts and now - entry.recent_restarts[0] > CRASH_LOOP_WINDOW:
+            entry.recent_restarts.popleft()
+        if len(entry.recent_restarts) >= CRASH_LOOP_RESTARTS:
+            print(f"Supervisor: {entry.name} is crash-looping, not restarting it again")
+            entry.state = 'crash-loop'
+            return
+        entry.state = 'backoff'
+        entry.next_restart = now + entry.backoff
+        entry.backoff = min(entry.backoff * 2, RESTART_BACKOFF_MAX)
+
+    def restart(self, entry):
+        with self.lock:
+            if entry.state != 'backoff':
+                return
+            entry.restarts += 1
+            entry.recent_restarts.append(time.time())
+        print(f"Supervisor: restarting {entry.name} (restart {entry.restarts})")
+        try:
+            process = launch_app(entry.name, entry.app_type, manual=False)
+            entry.last_error = None
+            if entry.app_type == 'web':
+                # Measure the restart's startup without holding up the supervisor
+                threading.Thread(target=check_startup, args=(entry.name, process), daemon=True).start()
+        except Exception as e:
+            print(f"Supervisor: restarting {entry.name} failed: {e}")
+            with self.lock:
+                entry.last_error = str(e)
+                # Count the failed launch like a crash
+                self.exited(entry, None, time.time())
+            self.publish(entry)
+
+supervisor = Supervisor()
+
+def wait_for_exit(pid, process=None, timeout=STOP_GRACE_PERIOD):
+    """True once the process is gone; waits on the Popen when we launched it"""
+    if process is not None:
+        try:
+            process.wait(timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+    deadline = time.time() + timeout
+    delay = 0.02
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # Exists, but belongs to someone else
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.2)
+
+def stop_process(pid, grace=STOP_GRACE_PERIOD):
+    """
+    SIGTERM a process, wait up to grace seconds for it to exit, then SIGKILL
+    it. Returns {pid, outcome, seconds, error} where outcome is stopped,
+    killed, not-running or failed.
+    """
+    pid = int(pid)
+    start = time.time()
+    result = {'pid': pid, 'outcome': 'stopped', 'seconds': 0.0, 'error': None}
+    supervisor.expect_exit(pid)
+    process = supervisor.process_for(pid)
+    try:
+        os.kill(pid, signal.SIGTERM)
+        if not wait_for_exit(pid, process, grace):
+            print(f"PID {pid} still running after {grace}s, sending SIGKILL")
+            os.kill(pid, signal.SIGKILL)
+            result['outcome'] = 'killed'
+            if not wait_for_exit(pid, process, STOP_KILL_WAIT):
+                result['outcome'] = 'failed'
+                result['error'] = f'Still running {STOP_KILL_WAIT}s after SIGKILL'
+    except ProcessLookupError:
+        # Gone already (or between SIGTERM and SIGKILL)
+        if result['outcome'] == 'stopped':
+            result['outcome'] = 'not-running'
+    except OSError as e:
+        result['outcome'] = 'failed'
+        result['error'] = str(e)
+    if result['outcome'] != 'failed':
+        port_allocator.release(pid)
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+def scan_apps_directory(directory, app_type):
+    """
+    One scandir pass over an apps directory. Returns ([(name, app_type)],
+    stamp) where stamp is the mtimes that have to stay the same for the
+    list to still be right: (directory mtime, [(folder, mtime), ...]) for
+    the web folders without an app.py yet, since one can appear later
+    without touching the directory itself.
+    """
+    apps = []
+    pending = []
+    try:
+        directory_mtime = os.stat(directory).st_mtime_ns
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if app_type == 'web':
+                    # Web apps are first level folders with an app.py
+                    if entry.is_dir():
+                        if os.path.exists(os.path.join(entry.path, 'app.py')):
+                            apps.append((entry.name, 'web'))
+                        else:
+                            pending.append((entry.path, entry.stat().st_mtime_ns))
+                elif entry.is_file() and not entry.name.endswith('.py') and os.access(entry.path, os.X_OK):
+                    apps.append((entry.name, 'cli'))
+    except FileNotFoundError:
+        return [], None
+    except OSError as e:
+        print(f'Error scanning apps directory: {e}')
+        return [], None
+    return apps, (directory_mtime, pending)
+
+class InstalledAppsIndex:
+    """
+    The installed CLI and web apps, shared by every page and API. A scan
+    is kept until install, delete or start invalidates it, or until one
+    of the directory mtimes it depends on changes (apps copied in by
+    hand), so pages never see stale lists and never rescan for nothing.
+    """
+
+    def __init__(self):
+        self.scans = {}  # app_type -> (stamp, apps)
+        self.lock = threading.Lock()
+
+    def directory(self, app_type):
+        return WEB_APPS_DIR if app_type == 'web' else CLI_APPS_DIR
+
+    def current(self, app_type, stamp):
+        """True if nothing the scan depends on has changed since"""
+        if stamp is None:
+            return not os.path.exists(self.directory(app_type))
+        directory_mtime, pending = stamp
+        try:
+            if os.stat(self.directory(app_type)).st_mtime_ns != directory_mtime:
+                return False
+            return all(os.stat(path).st_mtime_ns == mtime for path, mtime in pending)
+        except OSError:
+            return False
+
+    def apps(self, app_type):
+        """[(name, app_type)] for 'cli' or 'web'"""
+        with self.lock:
+            cached = self.scans.get(app_type)
+        if cached and self.current(app_type, cached[0]):
+            return cached[1]
+        apps, stamp = scan_apps_directory(self.directory(app_type), app_type)
+        with self.lock:
+            self.scans[app_type] = (stamp, apps)
+        return apps
+
+    def all(self):
+        return self.apps('cli') + self.apps('web')
+
+    def names(self, app_type):
+        return set(name for name, _ in self.apps(app_type))
+
+    def app_type(self, app_name):
+        """'web' or 'cli' for an installed app, None when it is not installed"""
+        if app_name in self.names('web'):
+            return 'web'
+        if app_name in self.names('cli'):
+            return 'cli'
+        return None
+
+    def invalidate(self):
+        with self.lock:
+            self.scans.clear()
+
+installed_apps = InstalledAppsIndex()
+
+def probe_ready(port, path=None, timeout=0.5):
+    """True when the port accepts a connection and, if path is given, answers it below 500"""
+    try:
+        if path is None:
+            socket.create_connection(('127.0.0.1', port), timeout=timeout).close()
+            return True
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        try:
+            conn.request('GET', path)
+            return conn.getresponse().status < 500
+        finally:
+            conn.close()
+    except (OSError, http.client.HTTPException):
+        return False
+
+def wait_until_ready(process, port, path=None, timeout=READY_TIMEOUT):
+    """
+    Poll a freshly launched app with exponential backoff until it is ready.
+    Returns (result, seconds) where result is 'ready', 'failed' (the
+    process exited) or 'timeout'.
+    """
+    start = time.time()
+    deadline = start + timeout
+    delay = READY_POLL_INITIAL
+    while True:
+        if process.poll() is not None:
+            return 'failed', time.time() - start
+        if probe_ready(port, path, timeout=min(0.5, max(0.05, deadline - time.time()))):
+            return 'ready', time.time() - start
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return 'timeout', time.time() - start
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, READY_POLL_MAX)
+
+class StartupStats:
+    """Recent startup results and latencies per app, so slow starters stand out"""
+
+    def __init__(self, history=READY_HISTORY):
+        self.history = history
+        self.apps = {}
+        self.lock = threading.Lock()
+
+    def record(self, app_name, result, seconds):
+        with self.lock:
+            runs = self.apps.setdefault(app_name, collections.deque(maxlen=self.history))
+            runs.append((time.time(), result, seconds))
+
+    def summary(self, app_name):
+        with self.lock:
+            runs = list(self.apps.get(app_name, ()))
+        if not runs:
+            return None
+        ready = [seconds for _, result, seconds in runs if result == 'ready']
+        return {
+            'app': app_name,
+            'starts': len(runs),
+            'last_result': runs[-1][1],
+            'last_seconds': round(runs[-1][2], 3),
+            'mean_seconds': round(sum(ready) / len(ready), 3) if ready else None,
+            'max_seconds': round(max(ready), 3) if ready else None,
+            'failed': sum(1 for _, result, _ in runs if result == 'failed'),
+            'timed_out': sum(1 for _, result, _ in runs if result == 'timeout'),
+        }
+
+    def report(self):
+        with self.lock:
+            names = list(self.apps)
+        # Slowest first
+        return sorted((self.summary(name) for name in names), key=lambda s: -(s['mean_seconds'] or 0))
+
+startup_stats = StartupStats()
+
+def check_startup(app_name, process):
+    """
+    Wait for a launched web app to become ready on its port (and the
+    app's optional ready_path setting) and record how long it took.
+    Returns (result, seconds, port).
+    """
+    with app_ports_lock:
+        port = app_ports.get(process.pid)
+    if port is None:
+        return 'timeout', 0.0, None
+    result, seconds = wait_until_ready(process, port, app_setting(app_name, 'ready_path'))
+    startup_stats.record(app_name, result, seconds)
+    print(f"{app_name} startup: {result} after {seconds:.2f}s")
+    status = supervisor.status(app_name)
+    if status:
+        event_hub.publish('supervisor', status)
+    return result, seconds, port
+
+def supervisor_status_html(app_name):
+    """Restart policy picker plus restart count and last exit code for a web app card"""
+    status = supervisor.status(app_name)
+    policy = app_setting(app_name, 'restart', DEFAULT_RESTART_POLICY)
+    options = ''.join(
+        f'<option value="{name}"{" selected" if name == policy else ""}>{name}</option>' for name in RESTART_POLICIES
+    )
+    details = ''
+    startup = startup_stats.summary(app_name)
+    if startup and startup['last_result'] == 'ready':
+        details = f"started in {startup['last_seconds']:.1f}s"
+    if status and (status['restarts'] or status['last_exit'] is not None):
+        details += ' &middot; ' if details else ''
+        details += f"restarts: {status['restarts']}"
+        if status['last_exit'] is not None:
+            details += f" &middot; last exit: {status['last_exit']}"
+        if status['state'] == 'crash-loop':
+            details += ' &middot; crash loop'
+    return (f'<div class="app-supervision">restart: <select class="restart-policy" '
+            f'onchange="setRestartPolicy(\'{app_name}\', this.value)">{options}</select> '
+            f'<span class="supervision-details">{details}</span></div>')
+
+class PooledTCPServer(socketserver.TCPServer):
+    """
+    TCPServer that hands each connection to a bounded pool of worker threads.
+    A slow request (app download, pidin, netstat) only ties up one worker
+    instead of blocking every other client.
+    """
+    allow_reuse_address = True
+    request_queue_size = SERVER_BACKLOG
+
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS):
+        self.workers = workers
+        self.active = 0  # Connections being handled right now
+        self.active_lock = threading.Lock()
+        # Kept-alive connections, event streams and log follows can all park a
+        # worker; at least one is always left for ordinary requests
+        parked = SSE_MAX_STREAMS + LOG_MAX_FOLLOWERS
+        self.keepalive_slots = threading.BoundedSemaphore(max(0, min(KEEPALIVE_MAX_CONNECTIONS, workers - parked - 1)))
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='berrypy-http')
+        self.worker_slots = threading.BoundedSemaphore(workers)
+        self.closing = threading.Event()  # Tells long-lived responses (event streams) to end
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        # Wait for a free worker so excess connections stay in the listen
+        # backlog instead of piling up in memory
+        self.worker_slots.acquire()
+        try:
+            self.executor.submit(self.process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor already shut down
+            self.worker_slots.release()
+            self.shutdown_request(request)
+
+    def process_request_worker(self, request, client_address):
+        with self.active_lock:
+            self.active += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.active_lock:
+                self.active -= 1
+            self.shutdown_request(request)
+            self.worker_slots.release()
+
+    def is_busy(self):
+        """True when most workers are occupied"""
+        return self.active * 2 > self.workers
+
+    def server_close(self):
+        self.closing.set()
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+def make_server(port, workers=SERVER_WORKERS):
+    """Create the HTTP server: pooled when workers > 1, single-threaded otherwise"""
+    if workers > 1:
+        return PooledTCPServer(("", port), TaskManagerHandler, workers)
+    return socketserver.TCPServer(("", port), TaskManagerHandler)
 
 class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_IDLE_TIMEOUT  # Idle kept-alive connections are dropped after this
+    # Buffer each response so headers and body leave in one write (flushed by
+    # handle_one_request), and don't let Nagle hold back the last segment
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.has_keepalive_slot = False
+        self.requests_on_connection = 0
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away mid-response (a page with an event
+            # stream or log follow navigating away); nothing to report
+            self.close_connection = True
+
+    def finish(self):
+        if self.has_keepalive_slot:
+            self.server.keepalive_slots.release()
+            self.has_keepalive_slot = False
+        try:
+            super().finish()
+        except (BrokenPipeError, ConnectionResetError):
+            # Closing wfile flushes what is left of an aborted response
+            self.rfile.close()
+
+    def end_headers(self):
+        self.negotiate_keepalive()
+        super().end_headers()
+
+    def negotiate_keepalive(self):
+        """
+        Keep the connection open only while it holds one of the server's
+        keep-alive slots; otherwise tell the client it will be closed.
+        """
+        if self.close_connection:
+            return
+        self.requests_on_connection += 1
+        slots = getattr(self.server, 'keepalive_slots', None)
+        if not self.has_keepalive_slot and slots is not None:
+            self.has_keepalive_slot = slots.acquire(blocking=False)
+        if not self.has_keepalive_slot or self.requests_on_connection >= KEEPALIVE_MAX_REQUESTS:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+            return
+        if self.request_version == 'HTTP/1.0':
+            self.send_header('Connection', 'keep-alive')
+        self.send_header('Keep-Alive', f'timeout={KEEPALIVE_IDLE_TIMEOUT}, max={KEEPALIVE_MAX_REQUESTS - self.requests_on_connection}')
 
     def do_GET(self):
         parsed_path = urllib.parse.urlparse(self.path)
@@ -82,31 +3019,41 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             pid = params.get('pid', [''])[0]
             app_type = params.get('app_type', ['cli'])[0]
 
+            job = None
             if action == 'start' and app_name:
-                self.start_app(app_name, app_type)
+                job = jobs.submit('start', app_name, self.start_app, app_name, app_type)
             elif action == 'stop' and pid:
-                self.stop_app(pid)
+                job = jobs.submit('stop', pid, self.stop_app, pid)
             elif action == 'install' and app_name:
-                self.install_app(app_name, app_type)
+                job = jobs.submit('install', app_name, self.install_app, app_name, app_type)
             elif action == 'delete' and app_name:
-                self.delete_app(app_name, app_type)
+                job = jobs.submit('delete', app_name, self.delete_app, app_name, app_type)
             elif action == 'enable_auto_start' and app_name:
-                self.enable_auto_start_app(app_name, app_type)
+                job = jobs.submit('enable_auto_start', app_name, self.enable_auto_start_app, app_name, app_type)
             elif action == 'disable_auto_start' and app_name:
-                self.disable_auto_start_app(app_name)
+                job = jobs.submit('disable_auto_start', app_name, self.disable_auto_start_app, app_name)
+
+            # XHR callers ask for JSON and poll /api/jobs/<id>; plain links
+            # are redirected back right away while the job runs
+            if params.get('format', [''])[0] == 'json' or 'application/json' in self.headers.get('Accept', ''):
+                if job:
+                    self.send_json({'job_id': job.id, 'status_url': f'/api/jobs/{job.id}'}, 202)
+                else:
+                    self.send_json({'error': 'Unknown action or missing parameters'}, 400)
+                return
 
             referer = self.headers.get('Referer', '/')
             self.send_response(303)
             self.send_header('Location', referer)
+            self.send_header('Content-Length', 0)
+            if job:
+                self.send_header('X-Job-Id', job.id)
             self.end_headers()
 
         # Handle /auto-config page
         elif self.path.startswith('/auto-config'):
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
             html = self.generate_auto_config_html()
-            self.wfile.write(html.encode())
+            self.send_body(html, 'text/html')
 
         # New: handle /about page
         elif self.path == '/about':
@@ -125,27 +3072,546 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             self.serve_app_details()
         elif self.path == '/news':
             self.serve_news_page()
+        elif parsed_path.path == '/api/batch':
+            self.serve_batch(parsed_path.query)
+        elif parsed_path.path == '/api/control':
+            self.serve_control(parsed_path.query)
+        elif parsed_path.path == '/api/jobs' or parsed_path.path.startswith('/api/jobs/'):
+            self.serve_jobs(parsed_path.path)
+        elif parsed_path.path == '/api/compression-stats':
+            self.send_json(compression_report())
+        elif parsed_path.path == '/api/metrics':
+            self.serve_metrics(parsed_path.query)
+        elif parsed_path.path == '/api/events':
+            self.serve_events()
+        elif parsed_path.path.startswith('/api/logs/'):
+            self.serve_logs(parsed_path.path, parsed_path.query)
+        elif parsed_path.path == '/api/supervisor':
+            self.serve_supervisor(parsed_path.query)
+        elif parsed_path.path == '/api/startup-stats':
+            self.send_json({'apps': startup_stats.report()})
+        elif parsed_path.path == '/api/ports':
+            self.send_json({'leases': port_allocator.table()})
+        elif parsed_path.path == '/api/packages':
+            self.serve_packages(parsed_path.query)
+        elif parsed_path.path == '/api/package-cache':
+            self.send_json(package_cache.stats())
+        elif parsed_path.path == '/api/updates':
+            self.send_json({'updates': find_updates()})
+        elif parsed_path.path == '/api/upgrade':
+            self.serve_upgrade(parsed_path.query)
         
-        # Serve app icons
+        # Serve app icons and built CSS/JS
         elif self.path.startswith('/app-icons/'):
             self.serve_app_icon()
+        elif self.path.startswith('/static/'):
+            self.serve_static_asset()
 
         # Otherwise serve the main page
         else:
+            html = self.generate_html()
+            self.send_body(html, 'text/html')
+
+    def send_body(self, body, content_type, status=200, headers=None, variant_key=None, compress=True):
+        """
+        Send a complete response with Content-Length, gzip/deflate compressed
+        when the client accepts it and it pays off. Pass variant_key for
+        bodies that never change under that key (static files, icons) so
+        their compressed variants are computed once and kept in memory.
+        compress=False sends the body as is (e.g. byte ranges).
+        """
+        if isinstance(body, str):
+            body = body.encode()
+        raw_size = len(body)
+        compressible = compress and (variant_key is not None or content_type.startswith(COMPRESSIBLE_TYPES))
+        encoding = None
+        if compressible and raw_size >= COMPRESS_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding', ''))
+        if encoding:
+            busy = getattr(self.server, 'is_busy', lambda: False)()
+            compressed = compress_body(body, encoding, variant_key, busy)
+            if compressed is None:
+                encoding = None
+            else:
+                body = compressed
+
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', len(body))
+        if compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in (headers or {}).items():
+            if name == 'ETag' and encoding:
+                # Each encoding is a different representation
+                value = value[:-1] + '-' + encoding + '"'
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        record_compression(route_label(self.path), raw_size, len(body))
+
+    def send_json(self, data, status=200):
+        """Send a JSON response"""
+        self.send_body(json.dumps(data), 'application/json', status)
+
+    def serve_jobs(self, path):
+        """Serve background job state: /api/jobs lists them, /api/jobs/<id> shows one"""
+        job_id = path[len('/api/jobs'):].strip('/')
+        if not job_id:
+            self.send_json({'jobs': jobs.list()})
+            return
+        job = jobs.get(job_id)
+        if job is None:
+            self.send_json({'error': f'Unknown job {job_id}'}, 404)
+            return
+        self.send_json(job.to_dict())
+
+    def write_event(self, event, payload):
+        self.wfile.write(f'event: {event}\ndata: {payload}\n\n'.encode())
+
+    def serve_events(self):
+        """
+        Server-Sent Events stream of process changes, app start/stop and job
+        progress, so open pages update in place instead of reloading. The
+        stream holds a worker thread, so only SSE_MAX_STREAMS may be open
+        and each is closed after SSE_STREAM_SECONDS (the browser reconnects).
+        """
+        subscription = event_hub.subscribe()
+        if subscription is None:
+            body = json.dumps({'error': 'Too many live update streams'})
+            self.send_body(body, 'application/json', 503, {'Retry-After': str(SSE_STREAM_SECONDS)})
+            return
+        try:
+            self.close_connection = True
             self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
             self.end_headers()
-            html = self.generate_html()
-            self.wfile.write(html.encode())
+            self.wfile.write(f'retry: {SSE_RETRY_MS}\n\n'.encode())
+            # Current state first, so a reconnecting page catches up on what it missed
+            snapshot = process_sampler.snapshot()
+            self.write_event('snapshot', json.dumps({'processes': [
+                {'pid': pid, 'app': app_name_from_command(cmd), 'cmd': cmd} for pid, cmd in snapshot.processes
+            ]}))
+            self.wfile.flush()
+
+            deadline = time.time() + SSE_STREAM_SECONDS
+            closing = getattr(self.server, 'closing', threading.Event())
+            while time.time() < deadline and not closing.is_set():
+                events = subscription.get(process_sampler.interval)
+                if events:
+                    for event, payload in events:
+                        self.write_event(event, payload)
+                else:
+                    # Keeps the process sampler (and so process events) running
+                    # while the page is open, and finds clients that went away
+                    process_sampler.snapshot()
+                    self.wfile.write(b': ping\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            pass
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    def serve_logs(self, path, query):
+        """
+        Output of a launched app. /api/logs/<app> returns the last
+        LOG_TAIL_BYTES of its current log; ?offset=N returns what follows
+        byte N (Range: bytes=N-M works too), at most LOG_READ_SIZE at once.
+        With follow=1 and nothing new yet, waits up to LOG_FOLLOW_TIMEOUT for
+        more. X-Log-Offset is the offset to ask for next; X-Log-Rotated
+        means the log was rotated and reading restarted at 0.
+        """
+        app_name = urllib.parse.unquote(path[len('/api/logs/'):]).strip('/')
+        if not app_name or app_name != os.path.basename(app_name) or app_name.startswith('.'):
+            self.send_json({'error': 'Unknown app'}, 404)
+            return
+        log = log_capture.log_for(app_name, create=False)
+        if log is None or not os.path.exists(log.path):
+            self.send_json({'error': f'No log for {app_name}'}, 404)
+            return
+
+        params = urllib.parse.parse_qs(query)
+        try:
+            offset = int(params['offset'][0]) if 'offset' in params else None
+            length = max(0, min(LOG_READ_SIZE, int(params.get('bytes', [LOG_TAIL_BYTES])[0])))
+        except ValueError:
+            self.send_json({'error': 'offset and bytes must be numbers'}, 400)
+            return
+        size = log.size()
+        ranged = False
+        range_match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', '').strip())
+        if offset is None and range_match and any(range_match.groups()):
+            ranged = True
+            first, last = range_match.groups()
+            if first:
+                offset = int(first)
+                if last:
+                    length = max(0, min(LOG_READ_SIZE, int(last) - offset + 1))
+            else:
+                # bytes=-N: the last N bytes
+                length = min(LOG_READ_SIZE, int(last))
+        if offset is None:
+            offset = max(0, size - length)
+
+        if ranged and offset >= size:
+            self.send_body(b'', 'text/plain; charset=utf-8', 416, {'Content-Range': f'bytes */{size}'}, compress=False)
+            return
+        rotated = offset > size
+        if rotated:
+            offset = 0
+        elif params.get('follow', [''])[0] == '1' and offset == size and log_followers.acquire(blocking=False):
+            try:
+                rotations = log.rotations
+                deadline = time.time() + LOG_FOLLOW_TIMEOUT
+                closing = getattr(self.server, 'closing', threading.Event())
+                while log.size() <= offset and log.rotations == rotations and not closing.is_set():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    log.wait(offset, min(1.0, remaining))
+                if log.rotations != rotations:
+                    rotated, offset = True, 0
+            finally:
+                log_followers.release()
+            size = log.size()
+
+        data = log.read(offset, length)
+        headers = {
+            'Cache-Control': 'no-store',
+            'X-Log-Offset': str(offset + len(data)),
+            'X-Log-Size': str(size),
+        }
+        if rotated:
+            headers['X-Log-Rotated'] = '1'
+        status = 200
+        if ranged:
+            status = 206
+            headers['Content-Range'] = f'bytes {offset}-{offset + len(data) - 1}/{size}'
+        self.send_body(data, 'text/plain; charset=utf-8', status, headers, compress=not ranged)
+
+    def serve_supervisor(self, query):
+        """
+        /api/supervisor lists supervised apps (state, restarts, last exit
+        code); /api/supervisor?app=<name>&policy=always|on-failure|never sets
+        an app's restart policy.
+        """
+        params = urllib.parse.parse_qs(query)
+        app = params.get('app', [''])[0]
+        policy = params.get('policy', [''])[0]
+        if not policy:
+            if app:
+                status = supervisor.status(app)
+                self.send_json(status or {'app': app, 'policy': app_setting(app, 'restart', DEFAULT_RESTART_POLICY)})
+            else:
+                self.send_json({'apps': supervisor.status()})
+            return
+        if not app or policy not in RESTART_POLICIES:
+            self.send_json({'error': f"app and policy ({', '.join(RESTART_POLICIES)}) are required"}, 400)
+            return
+        save_app_setting(app, 'restart', None if policy == DEFAULT_RESTART_POLICY else policy)
+        print(f"Restart policy for {app}: {policy}")
+        self.send_json({'app': app, 'policy': policy})
+
+    def serve_metrics(self, query):
+        """
+        CPU/memory history of running apps: /api/metrics lists the latest
+        values for every process, /api/metrics?app=<name>&points=N returns
+        that app's series averaged down to N points.
+        """
+        params = urllib.parse.parse_qs(query)
+        app = params.get('app', [''])[0]
+        try:
+            points = max(1, min(METRICS_HISTORY, int(params.get('points', [METRICS_POINTS])[0])))
+        except ValueError:
+            self.send_json({'error': 'points must be a number'}, 400)
+            return
+
+        snapshot = process_sampler.snapshot()
+        processes = []
+        for pid, cmd in snapshot.processes:
+            app_name = self.extract_app_name_from_command(cmd)
+            if app and app_name != app:
+                continue
+            series = process_metrics.get(pid)
+            entry = {'pid': pid, 'app': app_name}
+            if not app:
+                cpu = series.cpu.values()[-1:] if series else []
+                rss = series.rss.values()[-1:] if series else []
+                entry['cpu'] = json_series(cpu)[0] if cpu else None
+                entry['rss'] = json_series(rss, 0)[0] if rss else None
+            elif series:
+                entry['times'] = json_series(downsample(series.times.values(), points), 1)
+                entry['cpu'] = json_series(downsample(series.cpu.values(), points))
+                entry['rss'] = json_series(downsample(series.rss.values(), points), 0)
+            else:
+                entry['times'], entry['cpu'], entry['rss'] = [], [], []
+            processes.append(entry)
+
+        if app and not processes:
+            self.send_json({'error': f'{app} is not running'}, 404)
+            return
+        self.send_json({'interval': process_sampler.interval, 'processes': processes})
+
+    def serve_batch(self, query):
+        """
+        Install or delete several apps in one request:
+        /api/batch?action=install&apps=name|type&apps=name|type&parallel=3
+        Responds 202 with a job id whose result holds per-app outcomes, or
+        with the finished job when wait=1 is passed.
+        """
+        params = urllib.parse.parse_qs(query)
+        action = params.get('action', [''])[0]
+        if action not in ('install', 'delete'):
+            self.send_json({'error': 'action must be install or delete'}, 400)
+            return
+
+        items = []
+        for value in params.get('apps', []):
+            for entry in value.split(','):
+                app_name, _, app_type = entry.strip().partition('|')
+                if app_name:
+                    items.append((app_name, app_type or 'cli'))
+        if not items:
+            self.send_json({'error': 'No apps given'}, 400)
+            return
+
+        try:
+            parallel = int(params.get('parallel', [BATCH_PARALLELISM])[0])
+        except ValueError:
+            parallel = BATCH_PARALLELISM
+        parallel = max(1, min(parallel, BATCH_MAX_PARALLELISM))
+
+        job = jobs.submit('batch', f'{action} {len(items)} apps', self.run_batch, action, items, parallel)
+        if params.get('wait', [''])[0] == '1':
+            job.done.wait()
+            self.send_json(job.to_dict())
+        else:
+            self.send_json({'job_id': job.id, 'status_url': f'/api/jobs/{job.id}'}, 202)
+
+    def run_batch(self, action, items, parallel):
+        """Run install/delete for each (app_name, app_type) with bounded parallelism"""
+        batch_job = current_job()
+        results = [None] * len(items)
+        finished = [0]
+        lock = threading.Lock()
+
+        def run_item(index, app_name, app_type):
+            item_job = Job(action, app_name)
+            if action == 'install':
+                # Listings and the details modal use bare names, packages end in .zip
+                zip_name = app_name if app_name.endswith('.zip') else app_name + '.zip'
+                jobs.run(item_job, self.install_app, (zip_name, app_type))
+            else:
+                jobs.run(item_job, self.delete_app, (app_name, app_type))
+            results[index] = {
+                'app_name': app_name,
+                'app_type': app_type,
+                'state': item_job.state,
+                'error': item_job.error,
+                'seconds': round(item_job.finished - item_job.started, 3),
+            }
+            with lock:
+                finished[0] += 1
+                if batch_job:
+                    batch_job.progress = finished[0] / len(items)
+                    batch_job.message = f'{finished[0]} of {len(items)} done'
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='berrypy-batch') as executor:
+            for index, (app_name, app_type) in enumerate(items):
+                executor.submit(run_item, index, app_name, app_type)
+
+        failed = [r['app_name'] for r in results if r['state'] != 'done']
+        if failed and batch_job:
+            batch_job.error = f"{len(failed)} of {len(items)} failed: {', '.join(failed)}"
+        return results
+
+    def serve_packages(self, query):
+        """
+        /api/packages lists installed packages (?type=cli|web to filter);
+        ?app=<name>&type=<type> returns one package with its file manifest
+        """
+        params = urllib.parse.parse_qs(query)
+        app_type = params.get('type', [None])[0]
+        app_name = params.get('app', [''])[0]
+        if app_name:
+            record = package_db.get(app_name, app_type or 'cli')
+            if record is None:
+                self.send_json({'error': f'{app_name} is not in the package database'}, 404)
+            else:
+                self.send_json(record)
+            return
+        self.send_json({'packages': package_db.summary(app_type)})
+
+    def serve_upgrade(self, query):
+        """
+        Upgrade outdated packages: /api/upgrade?all=1 or apps=name|type,...
+        New versions are downloaded and installed in parallel; running apps
+        among them are restarted afterwards, nothing else is touched.
+        Responds 202 with a job id, or with the finished job when wait=1.
+        """
+        params = urllib.parse.parse_qs(query)
+        updates = find_updates()
+        if params.get('all', [''])[0] != '1':
+            wanted = set()
+            for value in params.get('apps', []):
+                for entry in value.split(','):
+                    app_name, _, app_type = entry.strip().partition('|')
+                    if app_name:
+                        wanted.add((app_name, app_type or 'cli'))
+            if not wanted:
+                self.send_json({'error': 'No apps given'}, 400)
+                return
+            updates = [update for update in updates if (update['name'], update['type']) in wanted]
+
+        job = jobs.submit('upgrade', f'{len(updates)} apps', self.run_upgrade, updates)
+        if params.get('wait', [''])[0] == '1':
+            job.done.wait()
+            self.send_json(job.to_dict())
+        else:
+            self.send_json({'job_id': job.id, 'status_url': f'/api/jobs/{job.id}'}, 202)
+
+    def run_upgrade(self, updates, parallel=BATCH_PARALLELISM):
+        """Install each update with bounded parallelism, then restart it if it was running"""
+        upgrade_job = current_job()
+        results = [None] * len(updates)
+        finished = [0]
+        lock = threading.Lock()
+
+        def upgrade_one(index, update):
+            app_name, app_type = update['name'], update['type']
+            item_job = Job('install', app_name)
+            jobs.run(item_job, self.install_app, (app_name + '.zip', app_type))
+            result = dict(update, state=item_job.state, error=item_job.error, restarted=[])
+            if item_job.state == 'done':
+                running = [pid for pid, cmd in process_sampler.snapshot().processes
+                           if app_name_from_command(cmd) == app_name]
+                for pid in running:
+                    stopped = stop_process(pid, float(app_setting(app_name, 'stop_grace', STOP_GRACE_PERIOD)))
+                    if stopped['outcome'] != 'failed':
+                        result['restarted'].append(self.relaunch(app_name))
+            results[index] = result
+            with lock:
+                finished[0] += 1
+                if upgrade_job:
+                    upgrade_job.progress = finished[0] / len(updates)
+                    upgrade_job.message = f'{finished[0]} of {len(updates)} upgraded'
+                    publish_job(upgrade_job)
+
+        if updates:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='berrypy-upgrade') as executor:
+                for index, update in enumerate(updates):
+                    executor.submit(upgrade_one, index, update)
+
+        failed = [r['name'] for r in results if r['state'] != 'done']
+        if failed and upgrade_job:
+            upgrade_job.error = f"{len(failed)} of {len(updates)} failed: {', '.join(failed)}"
+        return results
+
+    def serve_control(self, query):
+        """
+        Stop or restart many apps in one request:
+        /api/control?action=stop|restart&targets=<app or pid>,...  (or all=1)
+        all=1 means the apps on the Manage Apps page: the ones BerryPy
+        launched plus running installed web apps, never other python
+        processes. Every target gets SIGTERM at once, SIGKILL after its grace period
+        (grace=N overrides), and the job result has each target's outcome.
+        Responds 202 with a job id, or with the finished job when wait=1.
+        """
+        params = urllib.parse.parse_qs(query)
+        action = params.get('action', [''])[0]
+        if action not in ('stop', 'restart'):
+            self.send_json({'error': 'action must be stop or restart'}, 400)
+            return
+        try:
+            grace = float(params['grace'][0]) if 'grace' in params else None
+        except ValueError:
+            self.send_json({'error': 'grace must be a number'}, 400)
+            return
+
+        # Resolve app names and PIDs against one process snapshot
+        running = [(pid, app_name_from_command(cmd)) for pid, cmd in process_sampler.snapshot().processes]
+        targets = []
+        if params.get('all', [''])[0] == '1':
+            managed = dict(supervisor.running())
+            for pid, app in running:
+                if pid not in managed and installed_apps.app_type(app) == 'web':
+                    managed[pid] = app
+            targets = [(pid, app) for pid, app in managed.items() if app != 'taskapp' and str(os.getpid()) != pid]
+        else:
+            names = [t.strip() for value in params.get('targets', []) for t in value.split(',') if t.strip()]
+            for name in names:
+                matches = [(pid, app) for pid, app in running if pid == name or app == name]
+                targets.extend(matches or [(None, name)])
+        if not targets and params.get('all', [''])[0] != '1':
+            self.send_json({'error': 'No targets given'}, 400)
+            return
+
+        job = jobs.submit('control', f'{action} {len(targets)} apps', self.run_control, action, targets, grace)
+        if params.get('wait', [''])[0] == '1':
+            job.done.wait()
+            self.send_json(job.to_dict())
+        else:
+            self.send_json({'job_id': job.id, 'status_url': f'/api/jobs/{job.id}'}, 202)
+
+    def run_control(self, action, targets, grace=None):
+        """Stop (and for restart, relaunch) each (pid, app_name) target in parallel"""
+        control_job = current_job()
+        results = [None] * len(targets)
+        finished = [0]
+        lock = threading.Lock()
+
+        def control_one(index, pid, app_name):
+            result = {'app': app_name, 'pid': pid}
+            if pid is None:
+                result.update(outcome='not-running', seconds=0.0, error=None)
+            else:
+                result.update(stop_process(pid, grace if grace is not None else float(app_setting(app_name, 'stop_grace', STOP_GRACE_PERIOD))))
+            if action == 'restart' and result['outcome'] != 'failed':
+                result['restart'] = self.relaunch(app_name)
+            results[index] = result
+            with lock:
+                finished[0] += 1
+                if control_job:
+                    control_job.progress = finished[0] / len(targets)
+                    control_job.message = f'{finished[0]} of {len(targets)} done'
+                    publish_job(control_job)
+
+        if targets:
+            workers = min(len(targets), CONTROL_MAX_PARALLELISM)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='berrypy-control') as executor:
+                for index, (pid, app_name) in enumerate(targets):
+                    executor.submit(control_one, index, pid, app_name)
+
+        failed = [r['app'] for r in results if r['outcome'] == 'failed' or (r.get('restart') or {}).get('error')]
+        if failed and control_job:
+            control_job.error = f"{len(failed)} of {len(targets)} failed: {', '.join(failed)}"
+        return results
+
+    def relaunch(self, app_name):
+        """Start an app again after a restart's stop; returns {pid, ready, startup_seconds, error}"""
+        app_type = installed_apps.app_type(app_name)
+        if app_type is None:
+            return {'pid': None, 'error': f'{app_name} is not installed'}
+        try:
+            process = launch_app(app_name, app_type)
+        except Exception as e:
+            return {'pid': None, 'error': str(e)}
+        result = {'pid': process.pid, 'error': None}
+        if app_type == 'web':
+            ready, seconds, _ = check_startup(app_name, process)
+            result.update(ready=ready, startup_seconds=round(seconds, 3))
+            if ready != 'ready':
+                result['error'] = f'{app_name} {ready} while starting'
+        return result
 
     def serve_available_cli_json(self):
         """Serve available CLI apps as JSON for lazy loading"""
         try:
             html = self.generate_available_cli_html()
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode())
+            self.send_body(html, 'text/html')
         except Exception as e:
             print(f"Error serving available CLI apps: {e}")
             self.send_error(500, 'Error loading CLI apps')
@@ -154,10 +3620,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
         """Serve available web apps as JSON for lazy loading"""
         try:
             html = self.generate_available_web_apps_html()
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode())
+            self.send_body(html, 'text/html')
         except Exception as e:
             print(f"Error serving available web apps: {e}")
             self.send_error(500, 'Error loading web apps')
@@ -187,105 +3650,69 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                 'install_url': install_url
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(response)
             
         except Exception as e:
             print(f"Error serving app details: {e}")
             self.send_error(500, 'Error loading app details')
 
+    def send_cacheable(self, data, content_type, etag, max_age):
+        """Send a static body with caching headers, or 304 if the client has it"""
+        # Compressed variants carry a -gzip/-deflate suffix on the same ETag
+        client_etag = re.sub(r'-(gzip|deflate)"$', '"', self.headers.get('If-None-Match', ''))
+        if client_etag == etag:
+            self.send_response(304)
+            self.send_header('ETag', self.headers.get('If-None-Match'))
+            self.send_header('Cache-Control', f'public, max-age={max_age}')
+            self.end_headers()
+            return
+        headers = {'ETag': etag, 'Cache-Control': f'public, max-age={max_age}'}
+        self.send_body(data, content_type, headers=headers, variant_key=etag)
+
     def serve_app_icon(self):
         """Serve app icon images from app-icons directory"""
         try:
             # Extract icon filename from path
             icon_name = self.path.split('/app-icons/')[-1]
-            icon_path = os.path.join(os.path.dirname(__file__), 'app-icons', icon_name)
+            icon = load_static_asset(os.path.join(BASE_DIR, 'app-icons'), icon_name)
             
-            if os.path.exists(icon_path):
+            if icon:
                 # Determine content type based on file extension
-                if icon_path.endswith('.png'):
-                    content_type = 'image/png'
-                elif icon_path.endswith('.jpg') or icon_path.endswith('.jpeg'):
-                    content_type = 'image/jpeg'
-                elif icon_path.endswith('.gif'):
-                    content_type = 'image/gif'
-                else:
-                    content_type = 'application/octet-stream'
-                
-                with open(icon_path, 'rb') as f:
-                    icon_data = f.read()
-                
-                self.send_response(200)
-                self.send_header('Content-type', content_type)
-                self.send_header('Content-Length', len(icon_data))
-                self.end_headers()
-                self.wfile.write(icon_data)
+                extension = os.path.splitext(icon_name)[1].lower()
+                content_type = STATIC_CONTENT_TYPES.get(extension, 'application/octet-stream')
+                etag, icon_data = icon
+                self.send_cacheable(icon_data, content_type, etag, ICON_MAX_AGE)
             else:
                 self.send_error(404, 'Icon not found')
         except Exception as e:
             print(f"Error serving icon: {e}")
             self.send_error(500, 'Error loading icon')
 
+    def serve_static_asset(self):
+        """Serve the hashed CSS/JS written by build_assets.py"""
+        try:
+            name = urllib.parse.urlparse(self.path).path[len('/static/'):]
+            extension = os.path.splitext(name)[1].lower()
+            asset = load_static_asset(STATIC_DIR, name) if extension in ('.css', '.js') else None
+            if asset:
+                etag, data = asset
+                self.send_cacheable(data, STATIC_CONTENT_TYPES[extension], etag, STATIC_MAX_AGE)
+            else:
+                self.send_error(404, 'Asset not found')
+        except Exception as e:
+            print(f"Error serving static asset: {e}")
+            self.send_error(500, 'Error loading asset')
+
     def get_app_description(self, app_name, app_type):
         """
         Fetch app description from catalog.json file on the server.
         Returns formatted HTML description or fallback text.
         """
         try:
-            # Construct URL to fetch catalog.json from the appropriate server
-            if app_type == 'cli':
-                catalog_url = urllib.parse.urljoin(AVAILABLE_APPS_URL, 'catalog.json')
-            else:  # web
-                catalog_url = urllib.parse.urljoin(WEB_APPS_URL, 'catalog.json')
-            
-            # Fetch and cache the catalog
-            catalog_data = get_cached_or_fetch(catalog_url, f'catalog_{app_type}')
-            
-            if catalog_data is None:
-                return f'<p>No description available for {app_name}.</p>'
-            
-            # Parse JSON
-            catalog = json.loads(catalog_data)
-            
-            # Get app info from catalog
-            if 'apps' in catalog and app_name in catalog['apps']:
-                app_info = catalog['apps'][app_name]
-                
-                # Build HTML description
-                html = '<div class="app-description">'
-                if 'name' in app_info:
-                    html += f'<h3>{app_info["name"]}</h3>'
-                if 'description' in app_info:
-                    html += f'<p>{app_info["description"]}</p>'
-                if 'version' in app_info:
-                    html += f'<p><strong>Version:</strong> {app_info["version"]}</p>'
-                if 'author' in app_info:
-                    html += f'<p><strong>Author:</strong> {app_info["author"]}</p>'
-                if 'category' in app_info:
-                    html += f'<p><strong>Category:</strong> {app_info["category"]}</p>'
-                if 'requirements' in app_info and app_info['requirements']:
-                    html += '<div class="app-requirements">'
-                    html += '<p><strong>Python Requirements:</strong></p>'
-                    html += '<p style="font-size: 12px; color: #aaa;">Install with:</p>'
-                    html += '<pre style="background: #1a1a1a; padding: 10px; border-radius: 4px; overflow-x: auto;">'
-                    for req in app_info['requirements']:
-                        html += f'python3 -m pip install {req}\n'
-                    html += '</pre>'
-                    html += '</div>'
-                html += '</div>'
-                
-                return html
-            else:
+            index = get_catalog_index(app_type)
+            if index is None or app_name not in index.descriptions:
                 return f'<p>No description available for {app_name}.</p>'
-                    
-        except (urllib.error.URLError, urllib.error.HTTPError, socket.timeout) as e:
-            print(f"Error fetching catalog.json for {app_name}: {e}")
-            return f'<p>No description available for {app_name}.</p>'
-        except json.JSONDecodeError as e:
-            print(f"Error parsing catalog.json: {e}")
-            return f'<p>No description available for {app_name}.</p>'
+            return index.descriptions[app_name]
         except Exception as e:
             print(f"Error processing catalog.json for {app_name}: {e}")
             return f'<p>No description available for {app_name}.</p>'
@@ -365,10 +3792,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             # Generate HTML content
             news_html = self.generate_news_html(news_data)
             
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(news_html.encode())
+            self.send_body(news_html, 'text/html')
             
         except Exception as e:
             print(f"Error serving news page: {e}")
@@ -611,12 +4035,10 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
     def serve_about_page(self):
         """Serve the about.html page."""
         try:
-            with open(ABOUT_TEMPLATE_PATH, 'r') as file:
-                html = file.read()
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode())
+            template = TEMPLATES['about']
+            html = template.render()
+            # No slots, so the page only changes with the template file
+            self.send_body(html, 'text/html', variant_key=('about', template.version))
         except Exception as e:
             print(f"Error loading about.html: {e}")
             self.send_error(500, 'Error loading about.html')
@@ -627,9 +4049,6 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             # Fetch the list of .apk files
             apks = self.fetch_android_apks()
 
-            with open(ANDROID_TEMPLATE_PATH, 'r') as file:
-                html = file.read()
-
             # Build app cards similar to available apps section
             if not apks:
                 apks_html = '<div class="no-apps">No APKs found.</div>'
@@ -658,13 +4077,10 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                     </div>'''
                 apks_html += '</div>'
 
-            # Replace a placeholder in android.html, e.g. <!-- apks_list -->, with our content
-            html = html.replace('<!-- apks_list -->', apks_html)
+            # Fill the <!-- apks_list --> placeholder in android.html with our content
+            html = TEMPLATES['android'].render(apks_list=apks_html)
 
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode())
+            self.send_body(html, 'text/html')
         except Exception as e:
             print(f"Error serving android.html: {e}")
             self.send_error(500, 'Error serving android.html')
@@ -678,90 +4094,105 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                 download_url = urllib.parse.urljoin(WEB_APPS_URL, app_name)
                 install_dir = WEB_APPS_DIR
             else:
-                print(f"Unknown app type:{app_type}" )
+                report_error(f"Unknown app type:{app_type}" )
                 return
 
-            print(f"Downloading {download_url}")
-            request = urllib.request.Request(download_url)
-            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
-                if response.status != 200:
-                    print(f"Failed to download {download_url}: Status {response.status}")
+            # The catalog version picks the cached zip; without a reachable
+            # catalog the most recently cached one is installed
+            package_name = os.path.splitext(app_name)[0]
+            catalog = get_catalog_index(app_type)
+            version = catalog_version(package_name, app_type) if catalog else None
+            cached = None
+            if version is not None or catalog is None:
+                cached = package_cache.lookup(package_name, app_type, version)
+            if cached:
+                print(f"Installing {app_name} from the package cache")
+                zip_path, entry = cached
+                sha256 = os.path.splitext(os.path.basename(zip_path))[0]
+                version = entry['version']
+            else:
+                print(f"Downloading {download_url}")
+                report_progress(0.05, f'Downloading {app_name}')
+
+                def download_progress(done, total):
+                    if total:
+                        report_progress(0.05 + 0.55 * done / total, f'Downloading {app_name} ({done // 1024} of {total // 1024} KB)')
+                    else:
+                        report_progress(0.05, f'Downloading {app_name} ({done // 1024} KB)')
+
+                download_path = os.path.join(DOWNLOAD_DIR, f'{app_type}-{app_name}')
+                try:
+                    download_file(download_url, download_path, download_progress)
+                except DownloadError as e:
+                    report_error(str(e))
                     return
-                zip_data = response.read()
+                print(f"Downloaded {app_name} to {download_path}")
+                zip_path, sha256 = package_cache.store(download_path, package_name, app_type, version)
 
             if not os.path.exists(install_dir):
                 os.makedirs(install_dir)
                 print(f"Created installation directory at: {install_dir}")
 
-            zip_path = os.path.join(install_dir, app_name)
-            with open(zip_path, 'wb') as f:
-                f.write(zip_data)
-            print(f"Downloaded {app_name} to {zip_path}")
+            report_progress(0.6, f'Extracting {app_name}')
 
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            # Downloads run in parallel, but only one install at a time
+            # writes into a given directory
+            with directory_locks.get(install_dir):
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    infos = [info for info in zip_ref.infolist() if not info.is_dir()]
+                package_size = sum(info.file_size for info in infos)
                 if app_type == 'web':
-                    app_folder = os.path.splitext(app_name)[0]
-                    extract_path = os.path.join(install_dir, app_folder)
-                    os.makedirs(extract_path, exist_ok=True)
-                    zip_ref.extractall(extract_path)
-                    print(f"Extracted {app_name} to {extract_path}")
+                    extract_path = os.path.join(install_dir, package_name)
+                    staging = os.path.join(install_dir, f'.staging-{package_name}-{uuid.uuid4().hex[:8]}')
                 else:
-                    # For CLI apps, handle lib/ directories specially
-                    lib_dir = os.path.expanduser('~/usr/local/lib')
-                    bin_dir = os.path.expanduser('~/usr/local/bin')
-                    
-                    for member in zip_ref.namelist():
-                        if member.startswith('lib/'):
-                            # Extract lib files to ~/usr/local/lib/
-                            # Remove 'lib/' prefix and extract to lib directory
-                            lib_file = member[4:]  # Remove 'lib/' prefix
-                            if lib_file:  # Skip empty directory entries
-                                target_path = os.path.join(lib_dir, lib_file)
-                                os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                                with zip_ref.open(member) as source, open(target_path, 'wb') as target:
-                                    target.write(source.read())
-                                print(f"Extracted library: {lib_file} to {lib_dir}")
-                        elif member.startswith('bin/'):
-                            # Extract bin files to ~/usr/local/bin/
-                            bin_file = member[4:]  # Remove 'bin/' prefix
-                            if bin_file:  # Skip empty directory entries
-                                target_path = os.path.join(bin_dir, bin_file)
-                                os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                                with zip_ref.open(member) as source, open(target_path, 'wb') as target:
-                                    target.write(source.read())
-                                print(f"Extracted binary: {bin_file} to {bin_dir}")
-                        else:
-                            # For other files, extract to bin directory
-                            if not member.endswith('/'):  # Skip directories
-                                target_path = os.path.join(bin_dir, member)
-                                os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                                with zip_ref.open(member) as source, open(target_path, 'wb') as target:
-                                    target.write(source.read())
-                                print(f"Extracted file: {member} to {bin_dir}")
-
-            # Make binaries executable
-            if app_type == 'cli':
-                self.ensure_cli_paths()
-                extracted_files = zip_ref.namelist()
-                for file in extracted_files:
-                    if not file.endswith('/'):
-                        if file.startswith('bin/'):
-                            file_path = os.path.join(bin_dir, file[4:])
-                        else:
-                            file_path = os.path.join(bin_dir, file)
-                        if os.path.exists(file_path):
-                            os.chmod(file_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-                            print(f"Made {file_path} executable")
+                    self.ensure_cli_paths()
+                    staging = os.path.join(os.path.dirname(CLI_APPS_DIR), f'.staging-{package_name}-{uuid.uuid4().hex[:8]}')
+                try:
+                    if app_type == 'web':
+                        members = [(info.filename, member_target(staging, info.filename)) for info in infos]
+                        extract_members(zip_path, members)
+                        if os.path.isdir(extract_path):
+                            carry_over_files(extract_path, staging, package_db.get(package_name, 'web'))
+                        swap_directory(staging, extract_path)
+                        written = [member_target(extract_path, info.filename) for info in infos]
+                        print(f"Extracted {app_name} to {extract_path}")
+                    else:
+                        # lib/ members go to ~/usr/local/lib, bin/ and everything else to ~/usr/local/bin
+                        written = []
+                        for info in infos:
+                            if info.filename.startswith('lib/'):
+                                written.append(member_target(CLI_LIB_DIR, info.filename[4:]))
+                            elif info.filename.startswith('bin/'):
+                                written.append(member_target(CLI_APPS_DIR, info.filename[4:]))
+                            else:
+                                written.append(member_target(CLI_APPS_DIR, info.filename))
+                        # Staged flat, one numbered file per member, then renamed into place
+                        staged = [os.path.join(staging, str(i)) for i in range(len(infos))]
+                        extract_members(zip_path, [(info.filename, path) for info, path in zip(infos, staged)])
+                        for info, path in zip(infos, staged):
+                            if not info.filename.startswith('lib/'):
+                                os.chmod(path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+                        swap_files(list(zip(staged, written)))
+                        print(f"Extracted {len(written)} files from {app_name} to {CLI_APPS_DIR} and {CLI_LIB_DIR}")
+                finally:
+                    shutil.rmtree(staging, ignore_errors=True)
+
+                stale = package_db.record(package_name, app_type, written, version, package_size, sha256)
+                if stale and app_type == 'cli':
+                    # Files the previous version had and this one dropped (a
+                    # web app's swapped-in directory never has them)
+                    remove_package_files(stale, [CLI_APPS_DIR, CLI_LIB_DIR])
 
-            os.remove(zip_path)
-            print(f"Removed temporary zip file: {zip_path}")
+            report_progress(1.0, f'Installed {app_name}')
 
         except Exception as e:
-            print(f"Error installing app {app_name}: {e}")
+            report_error(f"Error installing app {app_name}: {e}")
+        finally:
+            installed_apps.invalidate()
 
     def ensure_cli_paths(self):
         """Ensure CLI paths exist"""
-        for path in [CLI_APPS_DIR, os.path.expanduser('~/usr/local/lib')]:
+        for path in [CLI_APPS_DIR, CLI_LIB_DIR]:
             if not os.path.exists(path):
                 os.makedirs(path)
                 print(f"Created directory: {path}")
@@ -770,222 +4201,65 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
         try:
             if app_type == 'cli':
                 app_path = os.path.join(CLI_APPS_DIR, app_name)
-                if os.path.exists(app_path):
-                    os.remove(app_path)
-                    print(f"Deleted CLI app: {app_path}")
+                with directory_locks.get(CLI_APPS_DIR):
+                    # The package manifest lists its libraries too; apps
+                    # installed before the package database only have the binary
+                    package_name = package_db.owner(app_path, 'cli') or app_name
+                    files = package_db.remove(package_name, 'cli')
+                    if files is None:
+                        files = [app_path]
+                    remove_package_files(files, [CLI_APPS_DIR, CLI_LIB_DIR])
+                    print(f"Deleted CLI app: {package_name} ({len(files)} files)")
             elif app_type == 'web':
                 app_path = os.path.join(WEB_APPS_DIR, app_name)
-                if os.path.exists(app_path):
-                    import shutil
-                    shutil.rmtree(app_path)
-                    print(f"Deleted web app: {app_path}")
+                with directory_locks.get(WEB_APPS_DIR):
+                    if os.path.exists(app_path):
+                        shutil.rmtree(app_path)
+                        print(f"Deleted web app: {app_path}")
+                    package_db.remove(app_name, 'web')
         except Exception as e:
-            print(f"Error deleting app {app_name}: {e}")
+            report_error(f"Error deleting app {app_name}: {e}")
+        finally:
+            installed_apps.invalidate()
 
     def start_app(self, app_name, app_type='cli'):
         try:
+            process = launch_app(app_name, app_type)
+            if app_type == 'cli':
+                installed_apps.invalidate()  # launch_app may have just made it executable
             if app_type == 'web':
-                app_path = os.path.join(WEB_APPS_DIR, app_name, 'app.py')
-                if os.path.exists(app_path):
-                    # First read the port from app.py - this is now our primary method
-                    port = None
-                    try:
-                        with open(app_path, 'r') as f:
-                            content = f.read()
-                            # Look for PORT = XXXX pattern (most common in BB10 apps)
-                            port_match = re.search(r'PORT\s*=\s*(\d+)', content)
-                            if port_match:
-                                port = int(port_match.group(1))
-                                print(f"Found port {port} in {app_name}/app.py (PORT variable)")
-                            else:
-                                # Look for port in app.run() call: app.run(port=XXXX)
-                                port_match = re.search(r'app\.run\([^)]*port\s*=\s*(\d+)', content)
-                                if port_match:
-                                    port = int(port_match.group(1))
-                                    print(f"Found port {port} in {app_name}/app.py (app.run)")
-                    except Exception as e:
-                        print(f"Error reading port from app.py: {e}")
-                        return
-                    
-                    if not port:
-                        print(f"Could not find PORT in {app_name}/app.py")
-                        return
-                    
-                    # Start the process
-                    process = subprocess.Popen(['python3', app_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    print(f"Started web app: {app_name} with PID: {process.pid}")
-                    
-                    # Store the port immediately - we trust the PORT value in the file
-                    app_ports[process.pid] = port
-                    print(f"Using port {port} for {app_name}")
-                    
-                    # Give the app a moment to start
-                    time.sleep(2)
-                    
-                    # Verify the app started successfully
-                    if process.poll() is not None:
-                        print(f"ERROR: Process {process.pid} failed to start!")
-                        stdout, stderr = process.communicate()
-                        print(f"Process output: {stdout.decode()}")
-                        print(f"Process errors: {stderr.decode()}")
-                else:
-                    print(f"Web app not found: {app_path}")
-            else:
-                # Handle CLI apps
-                app_path = os.path.join(CLI_APPS_DIR, app_name)
-                if os.path.exists(app_path):
-                    # Make sure the file is executable
-                    os.chmod(app_path, os.stat(app_path).st_mode | stat.S_IXUSR)
-                    
-                    # Start the CLI app in background
-                    process = subprocess.Popen([app_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    print(f"Started CLI app: {app_name} with PID: {process.pid}")
-                else:
-                    print(f"CLI app not found: {app_path}")
-        except Exception as e:
-            print(f"Error starting app {app_name}: {e}")
-
-    def detect_app_port(self, pid, app_name):
-        """
-        Detect the actual port a web app is running on by checking netstat output
-        """
-        try:
-            print(f"DEBUG: Detecting port for PID {pid}, app {app_name}")
-            
-            # Method 1: Parse the app.py file for port configuration FIRST
-            # This is more reliable than network scanning
-            app_path = os.path.join(WEB_APPS_DIR, app_name, 'app.py')
-            if os.path.exists(app_path):
-                try:
-                    with open(app_path, 'r') as f:
-                        content = f.read()
-                        # Look for common port patterns
-                        import re
-                        
-                        patterns = [
-                            (r'PORT\s*=\s*(\d+)', 'PORT constant'),
-                            (r'port\s*=\s*(\d+)', 'port variable'),
-                            (r'server_address\s*=\s*\([^,]+,\s*(\d+)\)', 'server_address tuple'),
-                            (r'HTTPServer\(\s*\([^,]+,\s*(\d+)\)', 'HTTPServer tuple'),
-                            (r'app\.run\([^)]*port\s*=\s*(\d+)', 'app.run'),
-                            (r'TCPServer\([^)]*(\d+)\)', 'TCPServer')
-                        ]
-                        
-                        for pattern, desc in patterns:
-                            port_match = re.search(pattern, content, re.IGNORECASE)
-                            if port_match:
-                                try:
-                                    port = int(port_match.group(1))
-                                    if 1024 <= port <= 65535:  # Valid user port range
-                                        print(f"DEBUG: Found port {port} in app.py ({desc})")
-                                        # Verify the port is actually in use
-                                        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                                        sock.settimeout(0.1)
-                                        result = sock.connect_ex(('127.0.0.1', port))
-                                        sock.close()
-                                        if result == 0:  # Port is open
-                                            print(f"DEBUG: Verified port {port} is active")
-                                            return port
-                                except (ValueError, IndexError):
-                                    continue
-                except Exception as e:
-                    print(f"Error parsing app.py for port: {e}")
-
-            # Method 2: Try netstat (QNX style)
-            try:
-                output = subprocess.check_output(['netstat', '-an'], timeout=5, stderr=subprocess.DEVNULL).decode()
-                lines = output.strip().split('\n')
-                
-                # First pass: Look for exact PID match
-                for line in lines:
-                    if str(pid) in line and 'LISTEN' in line:
-                        parts = line.split()
-                        for part in parts:
-                            if ':' in part:
-                                try:
-                                    port = int(part.split(':')[-1])
-                                    if 1024 <= port <= 65535:
-                                        print(f"DEBUG: Found port {port} via netstat (PID match)")
-                                        return port
-                                except (ValueError, IndexError):
-                                    continue
-                
-                # Second pass: Look for listening ports in common ranges
-                web_ports = []
-                for line in lines:
-                    if 'LISTEN' in line:
-                        parts = line.split()
-                        for part in parts:
-                            if ':' in part:
-                                try:
-                                    port = int(part.split(':')[-1])
-                                    if 8000 <= port <= 9000:  # Common web app range
-                                        web_ports.append(port)
-                                except (ValueError, IndexError):
-                                    continue
-                
-                if len(web_ports) == 1:
-                    print(f"DEBUG: Found single listening web port: {web_ports[0]}")
-                    return web_ports[0]
-                elif web_ports:
-                    print(f"DEBUG: Found multiple web ports: {web_ports}")
-                    # Prefer port 8000 if available, as it's a common default
-                    if 8000 in web_ports:
-                        return 8000
-                    # Otherwise return the lowest port number
-                    return min(web_ports)
-                    
-            except Exception as e:
-                print(f"DEBUG: netstat check failed: {e}")
-            
-            # Method 3: Direct socket check of common ports
-            common_ports = [8000, 8080, 8001, 8002, 8003, 8004, 8005, 8006, 8007, 8008, 8009, 8010]
-            listening_ports = []
-            
-            for port in common_ports:
-                try:
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(0.1)
-                    result = sock.connect_ex(('127.0.0.1', port))
-                    sock.close()
-                    if result == 0:  # Port is open
-                        listening_ports.append(port)
-                except Exception:
-                    continue
-            
-            if len(listening_ports) == 1:
-                print(f"DEBUG: Found single listening port via socket check: {listening_ports[0]}")
-                return listening_ports[0]
-            elif listening_ports:
-                print(f"DEBUG: Multiple ports found via socket check: {listening_ports}")
-                # Prefer port 8000 if available
-                if 8000 in listening_ports:
-                    return 8000
-                # Otherwise return the lowest port number
-                return min(listening_ports)
-            
-            print(f"DEBUG: No port found for PID {pid}")
-            return None
-            
+                # Wait until it accepts connections rather than a fixed time
+                report_progress(0.5, f'Waiting for {app_name} to start')
+                result, seconds, port = check_startup(app_name, process)
+                if result == 'failed':
+                    print(f"Process output:\n{log_capture.tail(app_name, 2048)}")
+                    report_error(f"ERROR: Process {process.pid} failed to start!")
+                elif result == 'timeout':
+                    report_error(f"{app_name} did not accept connections on port {port} within {READY_TIMEOUT}s")
+                return {'ready': result, 'startup_seconds': round(seconds, 3), 'port': port}
+        except LaunchError as e:
+            report_error(str(e))
         except Exception as e:
-            print(f"Error detecting port for PID {pid}: {e}")
-            return None
+            report_error(f"Error starting app {app_name}: {e}")
 
     def stop_app(self, pid):
         try:
-            os.kill(int(pid), signal.SIGTERM)
-            print(f"Stopped app with PID: {pid}")
-            # Remove from port mapping
-            if int(pid) in app_ports:
-                del app_ports[int(pid)]
+            app_name = None
+            for process_pid, cmd in process_sampler.snapshot().processes:
+                if process_pid == str(pid):
+                    app_name = app_name_from_command(cmd)
+            grace = float(app_setting(app_name, 'stop_grace', STOP_GRACE_PERIOD)) if app_name else STOP_GRACE_PERIOD
+            result = stop_process(pid, grace)
+            if result['outcome'] == 'failed':
+                report_error(f"Error stopping app {pid}: {result['error']}")
+            else:
+                print(f"Stopped app with PID: {pid} ({result['outcome']} after {result['seconds']}s)")
+            return result
         except Exception as e:
-            print(f"Error stopping app {pid}: {e}")
+            report_error(f"Error stopping app {pid}: {e}")
 
     def generate_html(self):
         try:
-            with open(HTML_TEMPLATE_PATH, 'r') as file:
-                html = file.read()
-
             manage_apps_html = self.generate_manage_apps_html()
             installed_apps_html = self.generate_installed_apps_html()
             
@@ -993,125 +4267,18 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             available_cli_html = '<div id="available-cli-loading">Loading CLI apps...</div>'
             available_web_html = '<div id="available-web-loading">Loading web apps...</div>'
 
-            manage_apps_html = manage_apps_html if manage_apps_html is not None else ''
-            installed_apps_html = installed_apps_html if installed_apps_html is not None else ''
-
-            html = html.replace('<!-- manage_apps -->', manage_apps_html)
-            html = html.replace('<!-- installed_apps -->', installed_apps_html)
-            html = html.replace('<!-- available_cli_apps -->', available_cli_html)
-            html = html.replace('<!-- available_web_apps -->', available_web_html)
-
-            # Add lazy loading JavaScript (ES5 compatible)
-            lazy_script = '''
-            <script>
-            // ES5 compatible lazy loading
-            function loadAvailableApps() {
-                // Load CLI apps
-                var cliContainer = document.getElementById('available-cli-loading');
-                if (cliContainer) {
-                    var xhr1 = new XMLHttpRequest();
-                    xhr1.open('GET', '/api/available-cli', true);
-                    xhr1.onreadystatechange = function() {
-                        if (xhr1.readyState === 4) {
-                            if (xhr1.status === 200) {
-                                cliContainer.innerHTML = xhr1.responseText;
-                            } else {
-                                cliContainer.innerHTML = '<p>Error loading CLI apps</p>';
-                            }
-                        }
-                    };
-                    xhr1.send();
-                }
-
-                // Load web apps
-                var webContainer = document.getElementById('available-web-loading');
-                if (webContainer) {
-                    var xhr2 = new XMLHttpRequest();
-                    xhr2.open('GET', '/api/available-web', true);
-                    xhr2.onreadystatechange = function() {
-                        if (xhr2.readyState === 4) {
-                            if (xhr2.status === 200) {
-                                webContainer.innerHTML = xhr2.responseText;
-                            } else {
-                                webContainer.innerHTML = '<p>Error loading web apps</p>';
-                            }
-                        }
-                    };
-                    xhr2.send();
-                }
-            }
-
-            // Load available apps after page loads
-            if (document.readyState === 'loading') {
-                document.addEventListener('DOMContentLoaded', loadAvailableApps);
-            } else {
-                loadAvailableApps();
-            }
-            </script>
-            '''
-            html = html.replace('</body>', lazy_script + '</body>')
-
-            return html
+            return TEMPLATES['main'].render(
+                manage_apps=manage_apps_html,
+                installed_apps=installed_apps_html,
+                available_cli_apps=available_cli_html,
+                available_web_apps=available_web_html,
+            )
         except Exception as e:
             print(f'Error loading HTML template: {e}')
             return '<html><body><h1>Error loading HTML template</h1></body></html>'
 
     def extract_app_name_from_command(self, cmd):
-        """
-        Extract a user-friendly app name from a command string.
-        Examples:
-        - 'python3 /data/apps/myapp/app.py' -> 'myapp'
-        - '/usr/local/bin/tool' -> 'tool'
-        - 'python3 /data/apps/webserver/app.py' -> 'webserver'
-        - 'myapp' -> 'myapp'
-        """
-        try:
-            # Remove common prefixes and extract the app name
-            if '/data/apps/' in cmd:
-                # Web app pattern: /data/apps/appname/app.py
-                parts = cmd.split('/data/apps/')
-                if len(parts) > 1:
-                    app_part = parts[1].split('/')[0]
-                    return app_part
-            elif '/usr/local/bin/' in cmd:
-                # CLI app pattern: /usr/local/bin/toolname
-                parts = cmd.split('/usr/local/bin/')
-                if len(parts) > 1:
-                    app_part = parts[1].split()[0]  # Take first part before any args
-                    return app_part
-            elif 'app.py' in cmd:
-                # Generic app.py pattern
-                if '/apps/' in cmd:
-                    parts = cmd.split('/apps/')
-                    if len(parts) > 1:
-                        app_part = parts[1].split('/')[0]
-                        return app_part
-                elif '/data/' in cmd:
-                    parts = cmd.split('/data/')
-                    if len(parts) > 1:
-                        app_part = parts[1].split('/')[0]
-                        return app_part
-            
-            # Handle direct executable names (CLI apps)
-            if not '/' in cmd and not 'python' in cmd.lower():
-                # This might be a direct executable name
-                app_name = cmd.split()[0]  # Take first part before any args
-                return app_name
-            
-            # Fallback: try to extract from the end of the path
-            if cmd.endswith('app.py'):
-                # Remove 'app.py' and get the directory name
-                clean_cmd = cmd.replace('app.py', '').rstrip('/')
-                app_name = os.path.basename(clean_cmd)
-                if app_name:
-                    return app_name
-            
-            # Last resort: return a cleaned version of the command
-            return os.path.basename(cmd.split()[0]) if cmd.split() else 'Unknown App'
-            
-        except Exception as e:
-            print(f"Error extracting app name from command '{cmd}': {e}")
-            return 'Unknown App'
+        return app_name_from_command(cmd)
 
     def generate_processes_html(self):
         try:
@@ -1121,22 +4288,21 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             if not processes:
                 return '<div class="no-apps">No running apps detected. Try refreshing the page.</div>'
             
+            # Look up ports for all web apps in one go rather than per card
+            ports = port_registry.ports_for([
+                (int(pid), self.extract_app_name_from_command(cmd))
+                for pid, cmd in processes
+                if 'app.py' in cmd or '/data/apps/' in cmd
+            ])
+
             cards_html = ''
             for pid, cmd in processes:
                 # Extract user-friendly app name instead of showing full command
                 app_name = self.extract_app_name_from_command(cmd)
-                
-                # Check if we already have a port for this PID
-                pid_int = int(pid)
-                port = None
-                if pid_int in app_ports:
-                    port = app_ports[pid_int]
-                elif 'app.py' in cmd or '/data/apps/' in cmd:
-                    detected_port = self.detect_app_port(pid_int, app_name)
-                    if detected_port:
-                        app_ports[pid_int] = detected_port
-                        port = detected_port
-                        print(f"Detected port {detected_port} for existing process {pid} ({app_name})")
+                port = ports.get(int(pid))
+                if port is None:
+                    with app_ports_lock:
+                        port = app_ports.get(int(pid))
                 
                 # Create app card - slim horizontal layout
                 address_info = f'<div class="app-address">127.0.0.1:{port}</div>' if port else '<div class="app-address" style="opacity: 0.3;">—</div>'
@@ -1146,6 +4312,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                     <div class="app-info">
                         <div class="app-name">{app_name}</div>
                         {address_info}
+                        {process_metrics_html(pid)}
                     </div>
                     <div class="app-actions">'''
                 
@@ -1170,7 +4337,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
         """
         try:
             # Get all installed web apps
-            web_apps = self.scan_apps_directory(WEB_APPS_DIR, 'web')
+            web_apps = installed_apps.apps('web')
             
             # Get currently running processes to determine app status
             running_processes = self.get_python_processes()
@@ -1186,7 +4353,6 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             # Add taskapp itself if it's running (special case)
             taskapp_running = False
             taskapp_pid = None
-            taskapp_port = PORT  # Use the defined PORT constant
             
             for pid, cmd in running_processes:
                 if 'taskapp.py' in cmd:
@@ -1194,7 +4360,6 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                     taskapp_pid = pid
                     running_app_names.add('taskapp')
                     running_app_pids['taskapp'] = pid
-                    app_ports[int(pid)] = taskapp_port
                     break
             
             # Create a combined list of all web apps (installed + taskapp)
@@ -1208,6 +4373,13 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             # Sort apps: running first, then stopped, each group alphabetically
             all_web_apps.sort(key=lambda x: (x[0] not in running_app_names, x[0].lower()))
             
+            # Look up ports for all running apps in one go rather than per card
+            ports = port_registry.ports_for([
+                (int(running_app_pids[app]), app)
+                for app, app_type in all_web_apps
+                if app_type == 'web' and running_app_pids.get(app)
+            ])
+
             cards_html = ''
             for app, app_type in all_web_apps:
                 if app_type != 'web':
@@ -1221,14 +4393,8 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                 pid = None
                 if is_running:
                     pid = running_app_pids.get(app)
-                    if pid and int(pid) in app_ports:
-                        port = app_ports[int(pid)]
-                    elif pid:
-                        # Try to detect port
-                        detected_port = self.detect_app_port(int(pid), app)
-                        if detected_port:
-                            app_ports[int(pid)] = detected_port
-                            port = detected_port
+                    if pid:
+                        port = ports.get(int(pid))
                 
                 # Create app card with toggle functionality
                 status_class = 'running' if is_running else 'stopped'
@@ -1241,6 +4407,8 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                         <div class="app-name">{app}</div>
                         {address_info}
                         <div class="app-status">{status_text}</div>
+                        {process_metrics_html(pid) if is_running and pid else ''}
+                        {supervisor_status_html(app) if app != 'taskapp' else ''}
                     </div>
                     <div class="app-actions">'''
                 
@@ -1269,26 +4437,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
 
     def generate_installed_apps_html(self):
         try:
-            # Check cache first
-            current_time = time.time()
-            cache_key = 'installed_apps'
-            
-            if cache_key in apps_cache:
-                cached_time, cached_apps = apps_cache[cache_key]
-                if current_time - cached_time < APPS_CACHE_DURATION:
-                    all_apps = cached_apps
-                else:
-                    # Cache expired, rescan
-                    cli_apps = self.scan_apps_directory(CLI_APPS_DIR, 'cli')
-                    web_apps = self.scan_apps_directory(WEB_APPS_DIR, 'web')
-                    all_apps = cli_apps + web_apps
-                    apps_cache[cache_key] = (current_time, all_apps)
-            else:
-                # No cache, scan and cache
-                cli_apps = self.scan_apps_directory(CLI_APPS_DIR, 'cli')
-                web_apps = self.scan_apps_directory(WEB_APPS_DIR, 'web')
-                all_apps = cli_apps + web_apps
-                apps_cache[cache_key] = (current_time, all_apps)
+            all_apps = installed_apps.all()
 
             if not all_apps:
                 return '<div class="no-apps">No installed apps found.</div>'
@@ -1339,7 +4488,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
 
             print(f"Enabled auto-start for {app_name}.")
         except Exception as e:
-            print(f"Error enabling auto start for {app_name}: {e}")
+            report_error(f"Error enabling auto start for {app_name}: {e}")
 
     def disable_auto_start_app(self, app_name):
         try:
@@ -1370,7 +4519,7 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
 
             print(f"Disabled auto-start for {app_name}.")
         except Exception as e:
-            print(f"Error disabling auto start for {app_name}: {e}")
+            report_error(f"Error disabling auto start for {app_name}: {e}")
 
     def generate_available_cli_html(self):
         try:
@@ -1378,32 +4527,25 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             if available_zips is None:
                 return '<p>Error loading Command Line Utilities.</p>'
                 
-            installed_cli_apps = set(app for app, _ in self.scan_apps_directory(CLI_APPS_DIR, 'cli'))
+            installed_cli_apps = installed_apps.names('cli')
             # Exclude installed apps and hide taskapp from available list
             available_zips = [z for z in available_zips if os.path.splitext(z)[0] not in installed_cli_apps and os.path.splitext(z)[0] != 'taskapp']
 
             if not available_zips:
                 return '<p>No Command Line Utilities available.</p>'
 
-            # Fetch catalog to get icon information
-            catalog_url = urllib.parse.urljoin(AVAILABLE_APPS_URL, 'catalog.json')
-            catalog_data = get_cached_or_fetch(catalog_url, 'catalog_cli')
-            catalog = {}
-            if catalog_data:
-                try:
-                    catalog = json.loads(catalog_data).get('apps', {})
-                except:
-                    pass
+            # Catalog index supplies the icons
+            catalog_index = get_catalog_index('cli')
 
             apps_html = '<div class="apps-container">'
             for zip_file in available_zips:
                 app_name = os.path.splitext(zip_file)[0]
                 
                 # Get icon from catalog or use fallback
-                icon_html = f'<div class="app-icon-text">{app_name[0].upper()}</div>'
-                if app_name in catalog and 'icon' in catalog[app_name]:
-                    icon_file = catalog[app_name]['icon']
-                    icon_html = f'<img src="/app-icons/{icon_file}" width="48" height="48" alt="{app_name}" onerror="this.outerHTML=\'<div class=&quot;app-icon-text&quot;>{app_name[0].upper()}</div>\'">'
+                if catalog_index:
+                    icon_html = catalog_index.icon_html(app_name)
+                else:
+                    icon_html = f'<div class="app-icon-text">{app_name[0].upper()}</div>'
                 
                 apps_html += f'''
                 <div class="app-item" onclick="openModal('{app_name}', 'cli')" style="cursor: pointer;">
@@ -1424,32 +4566,25 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
             if available_zips is None:
                 return '<p>Error loading Web Apps.</p>'
                 
-            installed_web_apps = set(app for app, _ in self.scan_apps_directory(WEB_APPS_DIR, 'web'))
+            installed_web_apps = installed_apps.names('web')
             # Exclude installed apps and hide taskapp from available list
             available_zips = [z for z in available_zips if os.path.splitext(z)[0] not in installed_web_apps and os.path.splitext(z)[0] != 'taskapp']
 
             if not available_zips:
                 return '<p>No Web Apps available.</p>'
 
-            # Fetch catalog to get icon information
-            catalog_url = urllib.parse.urljoin(WEB_APPS_URL, 'catalog.json')
-            catalog_data = get_cached_or_fetch(catalog_url, 'catalog_web')
-            catalog = {}
-            if catalog_data:
-                try:
-                    catalog = json.loads(catalog_data).get('apps', {})
-                except:
-                    pass
+            # Catalog index supplies the icons
+            catalog_index = get_catalog_index('web')
 
             apps_html = '<div class="apps-container">'
             for zip_file in available_zips:
                 app_name = os.path.splitext(zip_file)[0]
                 
                 # Get icon from catalog or use fallback
-                icon_html = f'<div class="app-icon-text">{app_name[0].upper()}</div>'
-                if app_name in catalog and 'icon' in catalog[app_name]:
-                    icon_file = catalog[app_name]['icon']
-                    icon_html = f'<img src="/app-icons/{icon_file}" width="48" height="48" alt="{app_name}" onerror="this.outerHTML=\'<div class=&quot;app-icon-text&quot;>{app_name[0].upper()}</div>\'">'
+                if catalog_index:
+                    icon_html = catalog_index.icon_html(app_name)
+                else:
+                    icon_html = f'<div class="app-icon-text">{app_name[0].upper()}</div>'
                 
                 apps_html += f'''
                 <div class="app-item" onclick="openModal('{app_name}', 'web')" style="cursor: pointer;">
@@ -1540,115 +4675,10 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
 
     def get_python_processes(self):
         """
-        IMPROVED: Better process detection for QNX - looks for all relevant processes
+        Relevant running processes as [(pid, cmd), ...], from the shared
+        process snapshot
         """
-        processes = []
-        try:
-            # Use pidin ar to get all processes, then filter for relevant ones
-            output = subprocess.check_output(['pidin', 'ar'], timeout=5, stderr=subprocess.DEVNULL).decode()
-            lines = output.strip().split('\n')
-            
-            for line in lines:
-                if line.strip():
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        pid = parts[0]
-                        cmd = ' '.join(parts[1:])
-                        
-                        # Look for various types of running apps:
-                        # 1. Python processes (web apps, CLI tools)
-                        # 2. Processes in /data/apps/ directory
-                        # 3. Processes in /usr/local/bin/ directory
-                        # 4. Any process that looks like an app
-                        is_relevant = (
-                            'python' in cmd.lower() or
-                            '/data/apps/' in cmd or
-                            '/usr/local/bin/' in cmd or
-                            'app.py' in cmd or
-                            (cmd.endswith('.py') and not 'taskapp.py' in cmd)  # Exclude taskapp itself
-                        )
-                        
-                        if is_relevant:
-                            # Clean up command path for display
-                            if '/data/' in cmd:
-                                index = cmd.find('/data/') + len('/data/')
-                                cmd = cmd[index:]
-                            elif '/usr/local/bin/' in cmd:
-                                index = cmd.find('/usr/local/bin/') + len('/usr/local/bin/')
-                                cmd = cmd[index:]
-                            
-                            processes.append((pid, cmd))
-                            
-        except subprocess.CalledProcessError:
-            # Fallback: try with different pidin options
-            try:
-                output = subprocess.check_output(['pidin', '-f', '%a %A %n %p'], timeout=5, stderr=subprocess.DEVNULL).decode()
-                lines = output.strip().split('\n')
-                
-                for line in lines:
-                    if line.strip():
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            pid = parts[0]
-                            cmd = ' '.join(parts[1:])
-                            
-                            is_relevant = (
-                                'python' in cmd.lower() or
-                                '/data/apps/' in cmd or
-                                '/usr/local/bin/' in cmd or
-                                'app.py' in cmd or
-                                (cmd.endswith('.py') and not 'taskapp.py' in cmd)
-                            )
-                            
-                            if is_relevant:
-                                if '/data/' in cmd:
-                                    index = cmd.find('/data/') + len('/data/')
-                                    cmd = cmd[index:]
-                                elif '/usr/local/bin/' in cmd:
-                                    index = cmd.find('/usr/local/bin/') + len('/usr/local/bin/')
-                                    cmd = cmd[index:]
-                                
-                                processes.append((pid, cmd))
-                                
-            except Exception as e:
-                print(f'Error getting processes (fallback): {e}')
-        except Exception as e:
-            print(f'Error getting processes: {e}')
-        
-        return processes
-
-    def scan_apps_directory(self, directory, app_type):
-        apps = []
-        try:
-            if not os.path.exists(directory):
-                return apps
-            
-            # Optimized scanning - avoid deep recursion for better performance
-            if app_type == 'web':
-                # For web apps, only scan first level directories for app.py
-                try:
-                    for item in os.listdir(directory):
-                        item_path = os.path.join(directory, item)
-                        if os.path.isdir(item_path):
-                            app_py_path = os.path.join(item_path, 'app.py')
-                            if os.path.exists(app_py_path):
-                                apps.append((item, 'web'))
-                except OSError:
-                    pass
-            else:
-                # For CLI apps, scan only the bin directory itself
-                try:
-                    for file in os.listdir(directory):
-                        file_path = os.path.join(directory, file)
-                        if os.path.isfile(file_path) and not file.endswith('.py') and not file.startswith('.'):
-                            # Check if file is executable
-                            if os.access(file_path, os.X_OK):
-                                apps.append((file, 'cli'))
-                except OSError:
-                    pass
-        except Exception as e:
-            print(f'Error scanning apps directory: {e}')
-        return apps
+        return list(process_sampler.snapshot().processes)
 
     def generate_auto_config_html(self):
         """
@@ -1656,9 +4686,6 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
         with options to enable or disable auto start.
         """
         try:
-            with open(AUTO_CONFIG_TEMPLATE_PATH, 'r') as file:
-                html = file.read()
-
             all_apps = self.get_all_installed_apps()
 
             if not all_apps:
@@ -1677,16 +4704,13 @@ class TaskManagerHandler(http.server.BaseHTTPRequestHandler):
                             apps_html += f'<tr><td>{app}</td><td>{app_type.upper()}</td><td><a href="/action?action=enable_auto_start&app_name={app_encoded}&app_type={app_type}">Enable Auto Start</a></td></tr>'
                 apps_html += '</table>'
 
-            html = html.replace('<!-- installed_apps_auto -->', apps_html)
-            return html
+            return TEMPLATES['auto_config'].render(installed_apps_auto=apps_html)
         except Exception as e:
             print(f'Error loading auto-config HTML template: {e}')
             return '<html><body><h1>Error loading auto-config template</h1></body></html>'
 
     def get_all_installed_apps(self):
-        cli_apps = self.scan_apps_directory(CLI_APPS_DIR, 'cli')
-        web_apps = self.scan_apps_directory(WEB_APPS_DIR, 'web')
-        return cli_apps + web_apps
+        return installed_apps.all()
 
     def is_auto_start_enabled(self, app_name):
         """
@@ -1726,11 +4750,27 @@ if __name__ == '__main__':
     check_path()
     print("Starting optimized Task Manager...")
     print("Performance improvements:")
-    print("- Caching network requests (5min TTL)")
+    print("- Caching network requests on disk (5min TTL, revalidated with ETags)")
     print("- Timeout handling (10s timeout)")
-    print("- Optimized pidin usage")
+    print(f"- Shared process snapshots ({process_sampler.backend.name}, refreshed every {PROCESS_SAMPLE_INTERVAL:g}s while in use)")
     print("- Lazy loading for available apps")
+    print(f"- Concurrent request handling ({SERVER_WORKERS} workers, HTTP/1.1 keep-alive)")
+    print("- Precompiled page templates")
+    print(f"- Per-app CPU/memory history ({METRICS_HISTORY} samples per process, /api/metrics)")
+    print(f"- Live page updates over Server-Sent Events (up to {SSE_MAX_STREAMS} streams)")
+    print(f"- App output captured to {LOG_DIR} (rotated at {LOG_MAX_BYTES // 1024} KB, /api/logs/<app>)")
+    print("- Supervisor restarts apps by their restart policy, with backoff and crash-loop detection")
+    print(f"- Web app starts wait for readiness (up to {READY_TIMEOUT}s), startup times at /api/startup-stats")
+    print("- One installed-apps index for every page, refreshed on install/delete and directory changes")
+    print(f"- Package manifests, versions and sizes in {PACKAGE_DB_FILE} (/api/packages)")
+    print(f"- Downloaded packages cached by SHA-256 in {PACKAGE_CACHE_DIR} (up to {PACKAGE_CACHE_MAX_BYTES // (1024 * 1024)} MB, /api/package-cache)")
+    print("- Packages are extracted in a staging directory and renamed into place")
+    print("- Update checks against both catalogs (/api/updates), upgrade all via /api/upgrade?all=1")
+    print(f"- Port leases catch conflicts before launch (free ports {PORT_ASSIGN_RANGE[0]}-{PORT_ASSIGN_RANGE[1]} via BERRYPY_PORT, /api/ports)")
+    print(f"- Stop/restart many apps at once via /api/control (SIGKILL after {STOP_GRACE_PERIOD}s grace)")
     
-    with socketserver.TCPServer(("", PORT), TaskManagerHandler) as httpd:
+    compile_templates()
+    with make_server(PORT) as httpd:
+        port_allocator.bind(PORT, 'taskapp', os.getpid())
         print(f"Serving on port {PORT}")
         httpd.serve_forever() 
\ No newline at end of file